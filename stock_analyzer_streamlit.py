@@ -1,15 +1,23 @@
 import streamlit as st
 from datetime import datetime, timedelta
 import pandas as pd
-import akshare as ak
-import json
+import sqlite3
 
 # Import custom modules
-from utils.data_fetcher import get_stock_list, get_stock_data, get_sector_stocks
-from utils.analysis import analyze_stock, analyze_stock_commentary, analyze_support_resistance
+from utils.data_fetcher import (
+    get_stock_list, get_stock_data, get_sector_store,
+    get_sector_constituents
+)
+from utils.analysis import analyze_stock_commentary, analyze_support_resistance
 from utils.visualization import plot_stock_analysis, plot_sector_heatmap, plot_sector_stocks_heatmap
 from utils.market_overview import get_market_overview
-from utils.data_preprocessor import load_sector_data
+from utils.sector_store import sector_store_path
+from utils.datasets import dataset_version, load_dataset
+from utils.gateway import gateway, swr_cached
+from utils.market_session import INTRADAY, is_trading_time
+from utils.instrumentation import get_logger, metrics
+
+logger = get_logger('app')
 
 # 设置页面配置
 st.set_page_config(
@@ -19,20 +27,30 @@ st.set_page_config(
 )
 
 # 获取交易日历
-@st.cache_data(ttl=86400)  # 24小时缓存
+@st.cache_data(show_spinner=False)
+def load_local_trade_calendar(version):
+    # 后台刷新程序维护的交易日历，按数据集版本号缓存
+    return load_dataset('trade_calendar')
+
+def fetch_trade_calendar():
+    trade_cal = gateway.call('tool_trade_date_hist_sina')
+    trade_cal['trade_date'] = pd.to_datetime(trade_cal['trade_date'])
+    return trade_cal
+
 def get_trading_calendar():
     """获取最近一年的交易日历"""
     end_date = datetime.now()
     start_date = end_date - timedelta(days=365)
     try:
-        # 获取交易日历
-        trade_cal = ak.tool_trade_date_hist_sina()
-        trade_cal['trade_date'] = pd.to_datetime(trade_cal['trade_date'])
+        # 获取交易日历，优先使用本地数据集
+        trade_cal = load_local_trade_calendar(dataset_version('trade_calendar'))
+        if trade_cal is None:
+            trade_cal = fetch_trade_calendar()
         # 筛选日期范围内的交易日
         mask = (trade_cal['trade_date'] >= pd.Timestamp(start_date)) & (trade_cal['trade_date'] <= pd.Timestamp(end_date))
         return trade_cal[mask]['trade_date'].tolist()
     except Exception as e:
-        print(f"Error getting trading calendar: {e}")
+        logger.error("Error getting trading calendar: %s", e)
         return []
 
 # 获取交易日历
@@ -52,65 +70,67 @@ if 'tab_states' not in st.session_state:
     }
 
 # 缓存数据加载函数
-@st.cache_data(ttl=14400)  # 4小时缓存
+@swr_cached(ttl=INTRADAY)  # 盘中5分钟、休市时到下一次开盘，过期后返回旧值并在后台刷新
+def _load_market_data():
+    index_data, sector_df, concept_df = get_market_overview()
+    if not index_data and sector_df is None and concept_df is None:
+        # 全部获取失败时不缓存空结果，有旧值时回退到旧值
+        raise RuntimeError("市场概览数据获取失败")
+    return index_data, sector_df, concept_df
+
 def load_market_data():
-    return get_market_overview()
+    try:
+        return _load_market_data()
+    except Exception as e:
+        st.error(f"获取市场概览失败: {e}")
+        return {}, None, None
 
-@st.cache_data(ttl=43200)  # 12小时缓存
 def load_industry_list():
     try:
-        industry_df = ak.stock_board_industry_name_em()
+        industry_df = gateway.call('stock_board_industry_name_em')
         return industry_df['板块名称'].tolist()
     except Exception as e:
         st.error(f"获取行业板块列表失败: {e}")
         return []
 
-@st.cache_data(ttl=43200)  # 12小时缓存
 def load_concept_list():
     try:
-        concept_df = ak.stock_board_concept_name_em()
+        concept_df = gateway.call('stock_board_concept_name_em')
         return concept_df['板块名称'].tolist()
     except Exception as e:
         st.error(f"获取概念板块列表失败: {e}")
         return []
 
-@st.cache_data(ttl=1800)  # 30分钟缓存
 def load_sector_stocks(sector_type, sector_name):
-    if sector_type == "industry":
-        return ak.stock_board_industry_cons_em(symbol=sector_name)
-    else:
-        return ak.stock_board_concept_cons_em(symbol=sector_name)
+    # 成分股来自本地板块归属索引，行情来自共享的全市场快照
+    return get_sector_constituents(sector_type, sector_name)
 
 def get_stock_info(stock_code):
-    file_path = 'data/sector_data.json'
+    file_path = sector_store_path()
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            stock_data = json.load(f)
+        store = get_sector_store()
+        if store is None:
+            st.error(f"找不到数据文件: {file_path}")
+            return {}
         
-        # 获取股票信息
-        stock_info = stock_data.get('stocks', {}).get(stock_code, None)  # 添加 'stocks' 键的访问
+        stock_info = store.get_stock(stock_code)
         if stock_info is None:
             st.error(f"未找到股票代码 {stock_code} 的信息")
             return {}  # 返回空字典而不是 None
             
         return stock_info
-    except FileNotFoundError:
-        st.error(f"找不到数据文件: {file_path}")
-        return {}
-    except json.JSONDecodeError:
+    except sqlite3.Error:
         st.error("数据文件格式错误")
         return {}
 
 def display_stock_selector():
-    file_path = 'data/sector_data.json'
+    file_path = sector_store_path()
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            stock_data = json.load(f)
-        
-        # 从 'stocks' 键中获取股票列表
-        stocks = stock_data.get('stocks', {})
-        stock_list = [(code, f"{info['name']}({code})") for code, info in stocks.items()]
-        stock_list.sort(key=lambda x: x[0])
+        store = get_sector_store()
+        if store is None:
+            st.error(f"找不到数据文件: {file_path}")
+            return None
+        stock_list = [(code, f"{name}({code})") for code, name in store.list_stocks()]
         
         selected_stock = st.selectbox(
             "股票代码",
@@ -122,10 +142,7 @@ def display_stock_selector():
             stock_code = selected_stock.split('(')[1].split(')')[0]
             return stock_code
         return None
-    except FileNotFoundError:
-        st.error(f"找不到数据文件: {file_path}")
-        return None
-    except json.JSONDecodeError:
+    except sqlite3.Error:
         st.error("数据文件格式错误")
         return None
 
@@ -594,7 +611,7 @@ with current_tab[3]:   # 个股分析工具
             start_date = end_date - timedelta(days=int(trading_days * 1.4))  # 大约考虑周末和节假日
         
         with st.spinner('Loading and analyzing data...'):
-            df, trade_cal = get_stock_data(symbol, start_date, end_date)
+            df, trade_cal = get_stock_data(symbol, start_date, end_date, indicators='analysis')
             
             if df.empty:
                 st.error("No data available for the selected date range")
@@ -817,30 +834,38 @@ with st.sidebar:
     st.write("### 数据缓存控制")
     if st.button("清除所有缓存数据"):
         st.cache_data.clear()
+        gateway.invalidate()
         st.success("✅ 缓存已清除！")
     
     # 显示数据更新时间
     st.write("### 数据更新时间")
     st.info(f"""
-        - 市场概览: 4小时更新一次
-        - 板块数据: 12小时更新一次
-        - 个股数据: 8小时更新一次
-        - 股票列表: 24小时更新一次
+        - 实时行情: 交易时段内1分钟更新一次
+        - 市场概览、板块、个股数据: 交易时段内5分钟更新一次
+        - 板块历史、股票列表: 每个交易日收盘后更新
+        - 休市期间 (午休、收盘后、节假日) 使用缓存数据，下一次开盘后更新
         
         最后更新: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
     """)
 
     # 添加交易时段提示
-    now = datetime.now()
-    is_trading_time = (
-        now.weekday() < 5 and  # 周一到周五
-        ((now.hour == 9 and now.minute >= 30) or  # 9:30-11:30
-         (now.hour == 10) or
-         (now.hour == 11 and now.minute <= 30) or
-         (now.hour >= 13 and now.hour < 15))  # 13:00-15:00
-    )
-    
-    if is_trading_time:
+    if is_trading_time():
         st.warning("⚠️ 当前为交易时段，数据更新较频繁")
     else:
-        st.success("📊 当前为非交易时段，使用缓存数据") 
\ No newline at end of file
+        st.success("📊 当前为非交易时段，使用缓存数据")
+
+    # 显示各阶段耗时统计
+    st.write("### 性能指标")
+    with st.expander("各阶段耗时 (毫秒)"):
+        summary = metrics.summary()
+        if summary.empty:
+            st.info("暂无耗时记录")
+        else:
+            st.dataframe(summary.round(1), hide_index=True)
+        st.write(f"akshare 接口缓存 (数据后端: {gateway.backend.name})")
+        st.dataframe(gateway.stats(), hide_index=True)
+        st.write("上游接口保护 (熔断状态、超时与对冲)")
+        st.dataframe(gateway.guard.stats(), hide_index=True)
+        if st.button("重置耗时统计"):
+            metrics.reset()
+            st.success("✅ 耗时统计已重置！")
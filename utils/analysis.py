@@ -1,3 +1,5 @@
+from utils.instrumentation import timed
+
 def analyze_stock(df):
     """Analyze stock data and return signals"""
     signals = []
@@ -23,6 +25,7 @@ def analyze_stock(df):
         
     return signals
 
+@timed('commentary')
 def analyze_stock_commentary(df):
     """Generate professional stock analysis commentary"""
     # 获取最新数据和前一日数据
@@ -183,6 +186,19 @@ def analyze_stock_commentary(df):
     
     return commentary
 
+# 支撑压力位来源算法描述
+LEVEL_TYPE_DESC = {
+    '1': '枢轴点位法',
+    '2': '成交量分布法',
+    '3': '分形理论法'
+}
+
+def describe_level_type(type_info):
+    """将逗号分隔的来源算法代码转换为描述，多个算法以"+"连接"""
+    descs = [LEVEL_TYPE_DESC.get(code.strip(), '未知算法') for code in str(type_info).split(',')]
+    return '+'.join(descs)
+
+@timed('support_resistance_commentary')
 def analyze_support_resistance(df):
     """分析支撑压力位并生成HTML格式的分析报告"""
     if 'support_levels' not in df.columns or 'resistance_levels' not in df.columns:
@@ -223,12 +239,7 @@ def analyze_support_resistance(df):
                 support_distance = (current_price - support) / current_price * 100
                 
                 # 获取算法类型描述
-                type_info = support_types[idx]
-                type_desc = {
-                    '1': '枢轴点位法',
-                    '2': '成交量分布法',
-                    '3': '分形理论法'
-                }.get(str(type_info), '未知算法')
+                type_desc = describe_level_type(support_types[idx])
                 
                 strength_info = ""
                 if support_strengths:
@@ -252,12 +263,7 @@ def analyze_support_resistance(df):
                 resistance_distance = (resistance - current_price) / current_price * 100
                 
                 # 获取算法类型描述
-                type_info = resistance_types[idx]
-                type_desc = {
-                    '1': '枢轴点位法',
-                    '2': '成交量分布法',
-                    '3': '分形理论法'
-                }.get(str(type_info), '未知算法')
+                type_desc = describe_level_type(resistance_types[idx])
                 
                 strength_info = ""
                 if resistance_strengths:
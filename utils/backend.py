@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import akshare as ak
+import pandas as pd
+
+from utils.data_store import (
+    LIVE_DATA_DIR, RECORDINGS_DIR, atomic_write, get_store_lock, merge_ranges, replay_data_dir
+)
+from utils.instrumentation import get_logger
+
+logger = get_logger('backend')
+
+# 数据后端通过环境变量选择，应用、预处理与刷新程序都经网关使用同一个后端:
+#   STOCK_ANALYZER_BACKEND=live      直接调用 akshare (默认)
+#   STOCK_ANALYZER_BACKEND=record    调用 akshare，并把每次返回结果保存到录制目录
+#   STOCK_ANALYZER_BACKEND=replay    只从录制目录读取，不访问网络
+# STOCK_ANALYZER_RECORDINGS 指定录制目录；
+# STOCK_ANALYZER_REPLAY_LATENCY 为回放时模拟的延迟: 秒数，或 recorded 表示按录制时的耗时。
+# 回放模式下的本地数据写入独立的根目录 (见 utils.data_store.resolve_data_dir)
+
+# 按日期区间请求的K线接口及其日期列。这些接口按K线录制：同一标的 (接口名与日期以外的参数相同)
+# 的全部录制合并为一个文件并记录已覆盖的区间，回放时从中截取任意子区间，
+# 不要求与录制时的请求区间完全相同 (请求区间由当前日期计算，每天都不同)
+RANGED_ENDPOINTS = {
+    'stock_zh_a_hist': '日期',
+    'stock_zh_index_daily_em': 'date',
+}
+# 录制开始时复制到录制目录的本地数据 (板块归属、股票列表、交易日历与版本号)，
+# 回放时用于初始化回放根目录，回放不需要在线数据目录
+SNAPSHOT_DIR = 'local_data'
+SNAPSHOT_FILES = (
+    'sector_data.db', 'sector_data.json', 'sector_matrix.npz',
+    'sector_data_test.db', 'sector_data_test.json', 'sector_matrix_test.npz',
+    'stock_list.parquet', 'trade_calendar.parquet', 'versions.json',
+)
+
+
+class ReplayMissError(LookupError):
+    """回放模式下没有对应的录制结果"""
+
+
+class RecordedError(RuntimeError):
+    """录制时接口抛出的异常，回放时原样重现"""
+
+
+def request_key(endpoint, args, kwargs):
+    """请求的录制键：接口名与参数的哈希"""
+    payload = json.dumps([endpoint, list(args), sorted(kwargs.items())], ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def is_ranged_request(endpoint, kwargs):
+    return endpoint in RANGED_ENDPOINTS and 'start_date' in kwargs and 'end_date' in kwargs
+
+
+def split_range(kwargs):
+    """拆分出请求的日期区间，返回 (开始, 结束, 其余参数)"""
+    rest = {key: value for key, value in kwargs.items() if key not in ('start_date', 'end_date')}
+    return pd.Timestamp(kwargs['start_date']), pd.Timestamp(kwargs['end_date']), rest
+
+
+def bar_paths(directory, endpoint, args, kwargs):
+    """按K线录制的文件路径 (K线, 元数据)，kwargs 不含日期参数"""
+    folder = os.path.join(directory, endpoint, 'bars')
+    key = request_key(endpoint, args, kwargs)
+    return os.path.join(folder, f"{key}.parquet"), os.path.join(folder, f"{key}.json")
+
+
+class LiveBackend:
+    """直接调用 akshare"""
+
+    name = 'live'
+
+    def call(self, endpoint, *args, **kwargs):
+        return getattr(ak, endpoint)(*args, **kwargs)
+
+
+class RecordingBackend:
+    """调用内层后端，并把每次的返回结果与元数据保存到磁盘
+
+    每个请求保存为 <目录>/<接口名>/<录制键>.parquet (DataFrame) 与同名 .json 元数据
+    (参数、录制时间、耗时、异常信息)。同一请求再次调用时覆盖旧的录制。
+
+    Args:
+        directory: 录制目录
+        inner: 实际获取数据的后端，默认 LiveBackend
+    """
+
+    name = 'record'
+
+    def __init__(self, directory=RECORDINGS_DIR, inner=None):
+        self.directory = directory
+        self.inner = inner or LiveBackend()
+
+    def call(self, endpoint, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            value = self.inner.call(endpoint, *args, **kwargs)
+        except Exception as e:
+            if not is_ranged_request(endpoint, kwargs):
+                self._save(endpoint, args, kwargs, time.perf_counter() - start, error=e)
+            raise
+        if is_ranged_request(endpoint, kwargs):
+            self._save_bars(endpoint, args, kwargs, time.perf_counter() - start, value)
+        else:
+            self._save(endpoint, args, kwargs, time.perf_counter() - start, value=value)
+        return value
+
+    def _save_bars(self, endpoint, args, kwargs, elapsed, value):
+        """并入该标的已录制的K线，并记录新覆盖的日期区间"""
+        start, end, rest = split_range(kwargs)
+        data_path, meta_path = bar_paths(self.directory, endpoint, args, rest)
+        date_column = RANGED_ENDPOINTS[endpoint]
+        try:
+            with get_store_lock(('recording', data_path)):
+                ranges = []
+                bars = value
+                if os.path.exists(meta_path):
+                    with open(meta_path, 'r', encoding='utf-8') as f:
+                        ranges = [[pd.Timestamp(s), pd.Timestamp(e)] for s, e in json.load(f)['ranges']]
+                    recorded = pd.read_parquet(data_path)
+                    bars = pd.concat([df for df in (recorded, value) if not df.empty], ignore_index=True)
+                if not bars.empty:
+                    bars = bars.assign(_date=pd.to_datetime(bars[date_column]))
+                    bars = (bars.drop_duplicates('_date', keep='last').sort_values('_date')
+                            .drop(columns='_date').reset_index(drop=True))
+                metadata = {
+                    'endpoint': endpoint,
+                    'args': list(args),
+                    'kwargs': rest,
+                    'ranges': [[s.strftime('%Y-%m-%d'), e.strftime('%Y-%m-%d')]
+                               for s, e in merge_ranges(ranges + [[start, end]])],
+                    'recorded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'elapsed': round(elapsed, 4),
+                }
+                atomic_write(data_path, lambda tmp_path: bars.to_parquet(tmp_path, index=False))
+                atomic_write(meta_path, lambda tmp_path: _write_json(tmp_path, metadata))
+        except Exception as e:
+            logger.error("录制 %s 失败: %s", endpoint, e)
+
+    def _save(self, endpoint, args, kwargs, elapsed, value=None, error=None):
+        folder = os.path.join(self.directory, endpoint)
+        key = request_key(endpoint, args, kwargs)
+        metadata = {
+            'endpoint': endpoint,
+            'args': list(args),
+            'kwargs': kwargs,
+            'recorded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'elapsed': round(elapsed, 4),
+            'error': f"{type(error).__name__}: {error}" if error is not None else None,
+        }
+        try:
+            if error is None:
+                if not isinstance(value, pd.DataFrame):
+                    logger.warning("%s 返回的不是 DataFrame，不录制", endpoint)
+                    return
+                atomic_write(os.path.join(folder, f"{key}.parquet"), lambda tmp_path: value.to_parquet(tmp_path))
+            # 元数据最后写入，回放时以元数据存在作为录制完整的标志
+            atomic_write(os.path.join(folder, f"{key}.json"), lambda tmp_path: _write_json(tmp_path, metadata))
+        except Exception as e:
+            logger.error("录制 %s 失败: %s", endpoint, e)
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+
+
+class ReplayBackend:
+    """从录制目录读取结果，不访问网络
+
+    一般接口只做精确匹配 (接口名与全部参数相同)。RANGED_ENDPOINTS 中的K线接口
+    按标的匹配，请求区间须落在录制覆盖的区间内；录制结束之后的日期视为没有新的K线
+    (行情停在录制时)，请求早于录制覆盖范围时抛出 ReplayMissError。
+
+    Args:
+        directory: 录制目录
+        latency: 模拟延迟，None 不延迟，'recorded' 按录制时的耗时，数值为固定秒数
+    """
+
+    name = 'replay'
+
+    def __init__(self, directory=RECORDINGS_DIR, latency=None):
+        self.directory = directory
+        self.latency = latency
+
+    def call(self, endpoint, *args, **kwargs):
+        if is_ranged_request(endpoint, kwargs):
+            return self._replay_bars(endpoint, args, kwargs)
+        folder = os.path.join(self.directory, endpoint)
+        key = request_key(endpoint, args, kwargs)
+        meta_path = os.path.join(folder, f"{key}.json")
+        if not os.path.exists(meta_path):
+            raise ReplayMissError(f"没有录制结果: {endpoint} args={args} kwargs={kwargs}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+        self._sleep(metadata)
+        if metadata['error']:
+            raise RecordedError(metadata['error'])
+        return pd.read_parquet(os.path.join(folder, f"{key}.parquet"))
+
+    def _replay_bars(self, endpoint, args, kwargs):
+        start, end, rest = split_range(kwargs)
+        data_path, meta_path = bar_paths(self.directory, endpoint, args, rest)
+        if not os.path.exists(meta_path):
+            raise ReplayMissError(f"没有录制结果: {endpoint} args={args} kwargs={rest}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        ranges = [[pd.Timestamp(s), pd.Timestamp(e)] for s, e in metadata['ranges']]
+        recorded_end = ranges[-1][1]
+        if start <= recorded_end and not any(s <= start and min(end, recorded_end) <= e for s, e in ranges):
+            raise ReplayMissError(f"录制的K线未覆盖请求区间: {endpoint} args={args} kwargs={kwargs}")
+
+        self._sleep(metadata)
+        bars = pd.read_parquet(data_path)
+        if bars.empty:
+            return bars
+        dates = pd.to_datetime(bars[RANGED_ENDPOINTS[endpoint]])
+        return bars[(dates >= start) & (dates <= end)].reset_index(drop=True)
+
+    def _sleep(self, metadata):
+        if self.latency == 'recorded':
+            time.sleep(metadata['elapsed'])
+        elif self.latency:
+            time.sleep(self.latency)
+
+
+def parse_latency(value):
+    """解析 STOCK_ANALYZER_REPLAY_LATENCY"""
+    if not value:
+        return None
+    return value if value == 'recorded' else float(value)
+
+
+def _copy_file(source, target):
+    atomic_write(target, lambda tmp_path: shutil.copyfile(source, tmp_path))
+
+
+def snapshot_local_data(directory=RECORDINGS_DIR, data_dir=LIVE_DATA_DIR):
+    """录制开始时把本地数据 (SNAPSHOT_FILES) 复制到录制目录"""
+    for name in SNAPSHOT_FILES:
+        source = os.path.join(data_dir, name)
+        if os.path.exists(source):
+            _copy_file(source, os.path.join(directory, SNAPSHOT_DIR, name))
+
+
+def seed_replay_data(directory=RECORDINGS_DIR):
+    """回放开始时用录制的本地数据初始化回放根目录
+
+    回放根目录中没有该文件或录制的副本更新时复制，回放中由预处理、刷新程序写入的
+    更新的文件保留。
+    """
+    snapshot = os.path.join(directory, SNAPSHOT_DIR)
+    for name in SNAPSHOT_FILES:
+        source = os.path.join(snapshot, name)
+        target = os.path.join(replay_data_dir(directory), name)
+        if os.path.exists(source) and (
+            not os.path.exists(target) or os.path.getmtime(source) > os.path.getmtime(target)
+        ):
+            _copy_file(source, target)
+
+
+def create_backend(mode=None, directory=None, latency=None):
+    """按模式创建后端，参数为None时读取环境变量
+
+    录制模式先保存本地数据的副本，回放模式先用该副本初始化回放根目录。
+
+    Args:
+        mode: 'live' / 'record' / 'replay'
+        directory: 录制目录
+        latency: 回放延迟 (见 ReplayBackend)
+    """
+    mode = (mode or os.environ.get('STOCK_ANALYZER_BACKEND', 'live')).lower()
+    directory = directory or RECORDINGS_DIR
+    if mode == 'live':
+        return LiveBackend()
+    if mode == 'record':
+        snapshot_local_data(directory)
+        return RecordingBackend(directory)
+    if mode == 'replay':
+        seed_replay_data(directory)
+        if latency is None:
+            latency = parse_latency(os.environ.get('STOCK_ANALYZER_REPLAY_LATENCY'))
+        return ReplayBackend(directory, latency=latency)
+    raise ValueError(f"未知的数据后端: {mode}")
@@ -0,0 +1,84 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class RateLimiter:
+    """令牌桶限速器，可在多个线程间共享
+
+    Args:
+        rate: 每秒补充的令牌数 (即稳定状态下每秒允许的请求数)
+        burst: 桶容量，允许的瞬时突发请求数，默认等于 rate
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=8.0):
+    """指数退避加随机抖动 (full jitter)：在 [0, min(max_delay, base_delay * 2^attempt)] 内随机"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retry(func, *args, max_retries=3, base_delay=0.5, max_delay=8.0,
+                    limiter=None, **kwargs):
+    """调用函数，失败时按指数退避重试
+
+    Args:
+        func: 被调用的函数
+        max_retries: 最大尝试次数
+        base_delay: 首次重试的退避基数 (秒)
+        max_delay: 单次退避的上限 (秒)
+        limiter: 共享的 RateLimiter，每次尝试前取得令牌
+
+    Returns:
+        func 的返回值；全部尝试失败时抛出最后一次的异常
+    """
+    for attempt in range(max_retries):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
+
+
+def map_concurrent(func, items, max_workers=8):
+    """使用有界线程池并发执行 func(item)
+
+    Returns:
+        results: {item: 返回值}，按输入顺序排列
+        failures: {item: 异常}
+    """
+    results = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                failures[item] = e
+    results = {item: results[item] for item in items if item in results}
+    return results, failures
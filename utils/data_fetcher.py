@@ -1,12 +1,29 @@
-import akshare as ak
 import pandas as pd
 from datetime import datetime, timedelta
 import streamlit as st
-import time
-import numpy as np
+import os
+
+from utils.concurrency import RateLimiter, call_with_retry, map_concurrent
+from utils.data_store import load_ohlcv
+from utils.datasets import dataset_version, load_dataset
+from utils.gateway import gateway
+from utils.indicators import compute_indicators
+from utils.indicator_state import get_indicator_state
+from utils.instrumentation import get_logger, timed
+from utils.market_session import DAILY, INTRADAY
+from utils.sector_matrix import SectorMatrix, sector_matrix_path
+from utils.sector_store import MembershipIndex, SectorStore, migrate_legacy_json, sector_store_path
+from utils.support_resistance import (
+    LEVEL_SOURCES, calculate_atr, cluster_levels, find_fractals,
+    score_level_strength, volume_profile_levels
+)
+
+logger = get_logger('data_fetcher')
+
+# 按交易时段缓存的函数中，旧窗口条目的最长保留时间
+SESSION_CACHE_TTL = 86400
 
 # Tab1: 市场概览数据
-@st.cache_data(ttl=14400)  # 4小时缓存
 def get_market_overview():
     """Tab1: 获取市场概览数据"""
     try:
@@ -18,44 +35,47 @@ def get_market_overview():
         }
         
         market_data = {}
-        df = ak.stock_zh_index_spot()  # 只调用一次API
+        df = gateway.call('stock_zh_index_spot')  # 只调用一次API
         for name, code in indices.items():
             market_data[name] = df[df['代码'] == code].iloc[0].to_dict()
         
         # 获取行业板块数据
         try:
-            sector_df = ak.stock_board_industry_name_em()
+            sector_df = gateway.call('stock_board_industry_name_em')
         except Exception as e:
-            print(f"Error getting sector data: {e}")
+            logger.warning("Error getting sector data: %s", e)
             sector_df = None
             
         # 获取概念板块数据
         try:
-            concept_df = ak.stock_board_concept_name_em()
+            concept_df = gateway.call('stock_board_concept_name_em')
         except Exception as e:
-            print(f"Error getting concept data: {e}")
+            logger.warning("Error getting concept data: %s", e)
             concept_df = None
             
         return market_data, sector_df, concept_df
     except Exception as e:
-        print(f"Error getting market overview: {e}")
+        logger.error("Error getting market overview: %s", e)
         return {}, None, None
 
 # Tab2: 热门板块相关数据
-@st.cache_data(ttl=43200)  # 12小时缓存
 def get_hot_sectors_data():
     """Tab2: 获取热门板块数据，仅在Tab2中使用"""
     try:
-        df = ak.stock_board_industry_hist_em()
+        df = gateway.call('stock_board_industry_hist_em')
         df['日期'] = pd.to_datetime(df['日期'])
         return df
     except Exception as e:
-        print(f"Error getting hot sectors data: {e}")
+        logger.error("Error getting hot sectors data: %s", e)
         return pd.DataFrame()
 
-@st.cache_data(ttl=43200)
 def get_top_sectors_history(days=10, top_n=10):
-    """Tab2: 处理热门板块数据"""
+    """Tab2: 处理热门板块数据 (日频数据，缓存到下一次收盘)"""
+    return _get_top_sectors_history(days, top_n, DAILY.expires_at())
+
+# 缓存窗口的结束时间作为参数，窗口结束后缓存自然失效；ttl 只用于清理过期窗口的条目
+@st.cache_data(ttl=SESSION_CACHE_TTL)
+def _get_top_sectors_history(days, top_n, expires_at):
     try:
         df = get_hot_sectors_data()
         if df.empty:
@@ -94,55 +114,188 @@ def get_top_sectors_history(days=10, top_n=10):
         
         return result_df.sort_values(['上榜次数', '平均涨跌幅'], ascending=[False, False])
     except Exception as e:
-        print(f"Error processing top sectors: {e}")
+        logger.error("Error processing top sectors: %s", e)
         return pd.DataFrame()
 
 # Tab3: 板块个股分析相关数据
-@st.cache_data(ttl=43200)
 def get_all_sectors():
     """Tab3: 获取所有板块列表，仅在Tab3中使用"""
     try:
-        df = ak.stock_board_industry_name_em()
+        df = gateway.call('stock_board_industry_name_em')
         return df
     except Exception as e:
-        print(f"Error getting all sectors: {e}")
+        logger.error("Error getting all sectors: %s", e)
         return pd.DataFrame()
 
-@st.cache_data(ttl=43200)
 def get_sector_list():
     """获取所有板块列表"""
     try:
-        df = ak.stock_board_industry_name_em()
+        df = gateway.call('stock_board_industry_name_em')
         return df['板块名称'].tolist()
     except Exception as e:
-        print(f"Error getting sector list: {e}")
+        logger.error("Error getting sector list: %s", e)
         return []
 
-@st.cache_data(ttl=43200)
 def get_sector_stocks(sector_name):
     """获取板块成分股"""
     try:
-        df = ak.stock_board_industry_cons_em(symbol=sector_name)
+        df = gateway.call('stock_board_industry_cons_em', symbol=sector_name)
         return df
     except Exception as e:
-        print(f"Error getting sector stocks: {e}")
+        logger.error("Error getting sector stocks: %s", e)
         return None
 
 # Tab4: 个股分析工具相关数据
-@st.cache_data(ttl=86400, show_spinner=False)  # 24小时缓存
+@st.cache_data(show_spinner=False)
+def _load_local_stock_list(version):
+    """读取刷新程序维护的股票列表，按数据集版本号缓存"""
+    return load_dataset('stock_list')
+
 def get_stock_list():
-    """获取股票列表"""
+    """获取股票列表
+
+    优先使用后台刷新程序写入的本地股票列表 (版本号变化时重新加载)，
+    本地列表不存在时从接口获取。
+    """
     try:
-        df = ak.stock_info_a_code_name()
+        df = _load_local_stock_list(dataset_version('stock_list'))
+        if df is None:
+            df = gateway.call('stock_info_a_code_name')
         # 创建一个字典，键为 "股票名称 (股票代码)"，值为股票代码
         stock_dict = {f"{row['name']} ({row['code']})": row['code'] 
                      for _, row in df.iterrows()}
         return stock_dict
     except Exception as e:
-        print(f"Error getting stock list: {e}")
+        logger.error("Error getting stock list: %s", e)
         return {}
 
-def calculate_support_resistance(df, window=20, price_threshold=0.02, touch_count=2):
+def _sector_store_path(test_mode):
+    """板块归属数据库路径，数据库不存在时返回None
+
+    新检出的代码只有旧版 JSON，首次读取时转换一次。
+    """
+    path = sector_store_path(test_mode)
+    if not os.path.exists(path):
+        try:
+            migrate_legacy_json(test_mode)
+        except Exception as e:
+            logger.error("转换旧版板块数据失败: %s", e)
+    if not os.path.exists(path):
+        logger.warning("找不到板块归属数据库 %s", path)
+        return None
+    return path
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _open_sector_store(path, mtime):
+    """按 (路径, 修改时间) 缓存的只读数据库连接，文件更新后旧连接被淘汰"""
+    return SectorStore(path)
+
+def get_sector_store(test_mode=False):
+    """获取进程内共享的板块归属数据库
+
+    单只股票的查询 (个股板块归属) 直接按索引查找，不加载全部归属关系。
+
+    Returns:
+        SectorStore，数据文件不存在时返回None
+    """
+    path = _sector_store_path(test_mode)
+    if path is None:
+        return None
+    return _open_sector_store(path, os.path.getmtime(path))
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _load_membership_index(path, mtime):
+    """按 (路径, 修改时间) 缓存的进程级板块归属索引，文件更新后旧索引被淘汰"""
+    store = SectorStore(path)
+    try:
+        return MembershipIndex.from_store(store)
+    finally:
+        store.close()
+
+def get_membership_index(test_mode=False):
+    """获取进程内共享的板块归属索引
+
+    每个进程只加载一次，数据库文件的修改时间变化时重新加载。
+
+    Returns:
+        MembershipIndex，数据文件不存在时返回None
+    """
+    path = _sector_store_path(test_mode)
+    if path is None:
+        return None
+    return _load_membership_index(path, os.path.getmtime(path))
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _load_sector_matrix(path, mtime):
+    return SectorMatrix.load(path)
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _build_sector_matrix(db_path, mtime, _index):
+    return SectorMatrix.from_stocks(_index.to_dict())
+
+def get_sector_matrix(test_mode=False):
+    """获取进程内共享的股票×板块归属矩阵
+
+    优先加载预处理生成的矩阵文件；文件不存在时 (如由旧版 JSON 转换的数据)
+    从板块归属索引构建。两者均按文件修改时间缓存。
+
+    Returns:
+        SectorMatrix，数据文件不存在时返回None
+    """
+    path = sector_matrix_path(test_mode)
+    if os.path.exists(path):
+        return _load_sector_matrix(path, os.path.getmtime(path))
+    index = get_membership_index(test_mode)
+    if index is None:
+        return None
+    db_path = sector_store_path(test_mode)
+    return _build_sector_matrix(db_path, os.path.getmtime(db_path), index)
+
+def get_market_snapshot():
+    """获取全市场A股实时行情快照，所有板块视图共享同一份快照"""
+    try:
+        return gateway.call('stock_zh_a_spot_em')
+    except Exception as e:
+        logger.error("Error getting market snapshot: %s", e)
+        return None
+
+def fetch_sector_constituents(sector_type, sector_name):
+    """在线获取板块成分股行情"""
+    if sector_type == "industry":
+        return gateway.call('stock_board_industry_cons_em', symbol=sector_name)
+    return gateway.call('stock_board_concept_cons_em', symbol=sector_name)
+
+def get_sector_constituents(sector_type, sector_name):
+    """获取板块成分股及其行情
+
+    成分股从预处理的板块归属索引中查找，行情取自共享的全市场快照，
+    切换板块不再产生网络请求。索引中没有该板块 (如预处理之后新设立的板块)
+    或快照不可用时，回退到在线的成分股接口。
+
+    Args:
+        sector_type: 'industry' 或 'concept'
+        sector_name: 板块名称
+
+    Returns:
+        DataFrame: 成分股行情，列与 stock_zh_a_spot_em 相同；获取失败时返回None
+    """
+    index = get_membership_index()
+    members = index.get_sector_stocks(sector_type, sector_name) if index is not None else []
+    if members:
+        snapshot = get_market_snapshot()
+        if snapshot is not None and not snapshot.empty:
+            codes = [code for code, _ in members]
+            sector_stocks = snapshot[snapshot['代码'].isin(codes)].reset_index(drop=True)
+            if not sector_stocks.empty:
+                return sector_stocks
+
+    try:
+        return fetch_sector_constituents(sector_type, sector_name)
+    except Exception as e:
+        logger.error("Error getting sector constituents: %s", e)
+        return None
+
+def calculate_support_resistance(df, window=20, price_threshold=0.02, touch_count=2, atr_multiple=None):
     """计算支撑和压力位，使用多种专业技术分析方法，并计算强度分数
     
     Methods:
@@ -161,10 +314,12 @@ def calculate_support_resistance(df, window=20, price_threshold=0.02, touch_coun
         window: 寻找分形的窗口大小
         price_threshold: 价格聚类阈值
         touch_count: 确认支撑/压力位需要的最小触及次数
+        atr_multiple: 若提供，改用 ATR 的倍数作为聚类阈值
     
     Returns:
-        support_levels: List of (price, score) tuples for support levels
-        resistance_levels: List of (price, score) tuples for resistance levels
+        support_levels: List of (price, score, types) tuples for support levels
+        resistance_levels: List of (price, score, types) tuples for resistance levels
+        types 为逗号分隔的来源算法代码 (见 LEVEL_SOURCES)
     """
     
     def calculate_pivot_points(high, low, close):
@@ -176,184 +331,6 @@ def calculate_support_resistance(df, window=20, price_threshold=0.02, touch_coun
         s2 = pivot - (high - low)  # 支撑位2
         return [s2, s1], [r1, r2]
 
-    def calculate_volume_profile(df, num_bins=100):
-        """计算成交量分布，找出高成交量区域作为支撑压力位"""
-        price_range = df['Close'].max() - df['Close'].min()
-        bin_size = price_range / num_bins
-        
-        # 创建价格区间
-        price_bins = np.arange(df['Close'].min(), df['Close'].max(), bin_size)
-        
-        # 计算每个价格区间的成交量
-        volume_profile = []
-        for i in range(len(price_bins)-1):
-            mask = (df['Close'] >= price_bins[i]) & (df['Close'] < price_bins[i+1])
-            volume = df.loc[mask, 'Volume'].sum()
-            volume_profile.append((price_bins[i], volume))
-        
-        # 按成交量排序找出高成交量区域
-        volume_profile.sort(key=lambda x: x[1], reverse=True)
-        total_volume = sum(v for _, v in volume_profile)
-        
-        # 计算每个价位的成交量占比
-        volume_profile = [(price, volume/total_volume) for price, volume in volume_profile]
-        
-        # 取前20%的高成交量价位
-        num_levels = int(len(volume_profile) * 0.2)
-        high_volume_prices = sorted(volume_profile[:num_levels])
-        
-        # 区分支撑位和压力位
-        current_price = df['Close'].iloc[-1]
-        supports = [(p, v) for p, v in high_volume_prices if p < current_price]
-        resistances = [(p, v) for p, v in high_volume_prices if p > current_price]
-        
-        return supports, resistances
-
-    def calculate_level_strength(price, df):
-        """计算支撑/压力位的强度分数 (0-100)，使用专业的技术分析方法
-        
-        计分项目：
-        1. 成交量分析 (35分)
-            - 价位成交量占比 (20分)
-            - 大单交易占比 (15分)
-        2. 价格动量分析 (35分)
-            - 反弹/回落力度 (20分)
-            - 突破失败次数 (15分)
-        3. 时间衰减分析 (20分)
-            - 最近触及权重 (12分)
-            - 历史形成时间 (8分)
-        4. 技术指标确认 (10分)
-            - 与其他指标配合 (10分)
-        """
-        price_threshold = price * 0.005  # 0.5%的价格区间
-        
-        # 1. 成交量分析 (35分)
-        # 1.1 价位成交量占比 (20分)
-        volume_around_price = df.loc[abs(df['Close'] - price) <= price_threshold, 'Volume'].sum()
-        total_volume = df['Volume'].sum()
-        volume_ratio = volume_around_price / total_volume
-        volume_score = min(volume_ratio * 200, 20)  # 需要10%的成交量才能得满分
-        
-        # 1.2 大单交易占比 (15分) - 使用成交额作为替代指标
-        amount_around_price = df.loc[abs(df['Close'] - price) <= price_threshold, 'Amount'].sum()
-        total_amount = df['Amount'].sum()
-        large_trade_ratio = amount_around_price / total_amount
-        large_trade_score = min(large_trade_ratio * 150, 15)  # 需要10%的成交额才能得满分
-        
-        # 2. 价格动量分析 (35分)
-        # 2.1 反弹/回落力度 (20分)
-        bounces = []
-        for i in range(1, len(df)-1):
-            if abs(df['Low'].iloc[i] - price) <= price_threshold:
-                bounce = (df['High'].iloc[i+1] - df['Low'].iloc[i]) / df['Low'].iloc[i]
-                bounces.append(bounce)
-        avg_bounce = np.mean(bounces) if bounces else 0
-        bounce_score = min(avg_bounce * 400, 20)  # 需要5%的平均反弹幅度才能得满分
-        
-        # 2.2 突破失败次数 (15分)
-        failed_breakouts = 0
-        for i in range(1, len(df)-1):
-            if (abs(df['Low'].iloc[i] - price) <= price_threshold and 
-                df['Close'].iloc[i] > price and 
-                df['Close'].iloc[i+1] < price):
-                failed_breakouts += 1
-        breakout_score = min(failed_breakouts * 3, 15)  # 每次失败突破3分，最高15分
-        
-        # 3. 时间衰减分析 (20分)
-        # 3.1 最近触及权重 (12分)
-        recent_touches = 0
-        for i in range(max(0, len(df)-20), len(df)):  # 最近20个交易日
-            if abs(df['Close'].iloc[i] - price) <= price_threshold:
-                recent_touches += 1
-        recency_score = min(recent_touches * 3, 12)  # 每次近期触及3分，最高12分
-        
-        # 3.2 历史形成时间 (8分)
-        first_touch_idx = None
-        for i in range(len(df)):
-            if abs(df['Close'].iloc[i] - price) <= price_threshold:
-                first_touch_idx = i
-                break
-        if first_touch_idx is not None:
-            history_length = len(df) - first_touch_idx
-            history_score = min(history_length / len(df) * 8, 8)
-        else:
-            history_score = 0
-        
-        # 4. 技术指标确认 (10分)
-        # 4.1 与其他指标配合 (10分)
-        indicator_score = 0
-        last_idx = len(df) - 1
-        
-        # RSI确认
-        if 'RSI' in df.columns:
-            rsi = df['RSI'].iloc[last_idx]
-            if (price < df['Close'].iloc[last_idx] and rsi < 30) or \
-               (price > df['Close'].iloc[last_idx] and rsi > 70):
-                indicator_score += 3
-        
-        # MACD确认
-        if 'MACD' in df.columns and 'Signal' in df.columns:
-            macd = df['MACD'].iloc[last_idx]
-            signal = df['Signal'].iloc[last_idx]
-            if (price < df['Close'].iloc[last_idx] and macd > signal) or \
-               (price > df['Close'].iloc[last_idx] and macd < signal):
-                indicator_score += 3
-        
-        # 布林带确认
-        if 'BB_UPPER' in df.columns and 'BB_LOWER' in df.columns:
-            bb_upper = df['BB_UPPER'].iloc[last_idx]
-            bb_lower = df['BB_LOWER'].iloc[last_idx]
-            if (price < df['Close'].iloc[last_idx] and abs(price - bb_lower) / price < 0.02) or \
-               (price > df['Close'].iloc[last_idx] and abs(price - bb_upper) / price < 0.02):
-                indicator_score += 4
-        
-        # 计算总分
-        total_score = round(
-            volume_score +        # 成交量占比 (20分)
-            large_trade_score +   # 大单交易占比 (15分)
-            bounce_score +        # 反弹/回落力度 (20分)
-            breakout_score +      # 突破失败次数 (15分)
-            recency_score +       # 最近触及权重 (12分)
-            history_score +       # 历史形成时间 (8分)
-            indicator_score,      # 技术指标确认 (10分)
-            2
-        )
-        
-        # 打印详细的得分信息
-        print(f"\n价位 {price:.2f} 的强度分数详情:")
-        print(f"1. 成交量分析 (35分):")
-        print(f"   - 价位成交量占比: {volume_score:.2f}/20分 ({volume_ratio*100:.2f}%)")
-        print(f"   - 大单交易占比: {large_trade_score:.2f}/15分 ({large_trade_ratio*100:.2f}%)")
-        print(f"2. 价格动量分析 (35分):")
-        print(f"   - 反弹/回落力度: {bounce_score:.2f}/20分 (平均{avg_bounce*100:.2f}%)")
-        print(f"   - 突破失败次数: {breakout_score:.2f}/15分 ({failed_breakouts}次)")
-        print(f"3. 时间衰减分析 (20分):")
-        print(f"   - 最近触及权重: {recency_score:.2f}/12分 ({recent_touches}次)")
-        print(f"   - 历史形成时间: {history_score:.2f}/8分")
-        print(f"4. 技术指标确认: {indicator_score:.2f}/10分")
-        print(f"总分: {total_score}/100")
-        
-        return total_score
-
-    def find_fractals(df, window):
-        """寻找分形顶底，作为潜在的支撑压力位"""
-        highs = []
-        lows = []
-        
-        # 使用Williams分形理论
-        for i in range(window, len(df) - window):
-            # 顶分形
-            if all(df['High'].iloc[i] > df['High'].iloc[i-window:i]) and \
-               all(df['High'].iloc[i] > df['High'].iloc[i+1:i+window+1]):
-                highs.append(df['High'].iloc[i])
-            
-            # 底分形
-            if all(df['Low'].iloc[i] < df['Low'].iloc[i-window:i]) and \
-               all(df['Low'].iloc[i] < df['Low'].iloc[i+1:i+window+1]):
-                lows.append(df['Low'].iloc[i])
-        
-        return lows, highs
-
     # 1. 计算最近的枢轴点位
     recent_high = df['High'].iloc[-window:].max()
     recent_low = df['Low'].iloc[-window:].min()
@@ -361,202 +338,178 @@ def calculate_support_resistance(df, window=20, price_threshold=0.02, touch_coun
     pivot_supports, pivot_resistances = calculate_pivot_points(recent_high, recent_low, recent_close)
     
     # 2. 计算成交量分布支撑压力位
-    volume_supports, volume_resistances = calculate_volume_profile(df)
+    volume_supports, volume_resistances = volume_profile_levels(df)
     
     # 3. 计算分形支撑压力位
-    fractal_supports, fractal_resistances = find_fractals(df, window)
+    fractals = find_fractals(df, window)
+    fractal_supports = fractals.loc[fractals['kind'] == 'bottom', 'price'].tolist()
+    fractal_resistances = fractals.loc[fractals['kind'] == 'top', 'price'].tolist()
     
-    # 合并所有支撑位和压力位
+    # 合并所有支撑位和压力位，并记录来源算法
     all_supports = (
-        [(p, 0) for p in pivot_supports] + 
-        volume_supports + 
-        [(p, 0) for p in fractal_supports]
+        [(p, LEVEL_SOURCES['pivot']) for p in pivot_supports] + 
+        [(p, LEVEL_SOURCES['volume']) for p, _ in volume_supports] + 
+        [(p, LEVEL_SOURCES['fractal']) for p in fractal_supports]
     )
     all_resistances = (
-        [(p, 0) for p in pivot_resistances] + 
-        volume_resistances + 
-        [(p, 0) for p in fractal_resistances]
+        [(p, LEVEL_SOURCES['pivot']) for p in pivot_resistances] + 
+        [(p, LEVEL_SOURCES['volume']) for p, _ in volume_resistances] + 
+        [(p, LEVEL_SOURCES['fractal']) for p in fractal_resistances]
     )
     
-    def cluster_levels_with_strength(levels, threshold, df):
+    atr = calculate_atr(df) if atr_multiple is not None else None
+    threshold = atr_multiple if atr_multiple is not None else price_threshold
+    
+    def cluster_levels_with_strength(levels):
         """对价位进行聚类并计算强度"""
-        if not levels:
+        clusters = [c for c in cluster_levels(levels, threshold, atr=atr) if c[1] >= touch_count]
+        if not clusters:
             return []
-            
-        # 按价格排序
-        sorted_levels = sorted(levels, key=lambda x: x[0])
-        clusters = []
-        
-        for price, _ in sorted_levels:
-            found_cluster = False
-            for cluster in clusters:
-                if abs(price - np.mean([p for p, _ in cluster])) / np.mean([p for p, _ in cluster]) < threshold:
-                    cluster.append((price, 0))
-                    found_cluster = True
-                    break
-            if not found_cluster:
-                clusters.append([(price, 0)])
         
-        # 计算每个聚类的平均价格和强度分数
-        result = []
-        for cluster in clusters:
-            if len(cluster) >= touch_count:
-                avg_price = np.mean([p for p, _ in cluster])
-                strength = calculate_level_strength(avg_price, df)
-                result.append((avg_price, strength))
+        # 一次性批量计算所有聚类价位的强度分数
+        strengths = score_level_strength([price for price, _, _ in clusters], df)['total']
+        result = [(price, float(strength), ','.join(sources))
+                  for (price, _, sources), strength in zip(clusters, strengths)]
         
         return sorted(result, key=lambda x: (-x[1], x[0]))  # 按强度降序，价格升序排序
     
     # 对支撑位和压力位进行聚类并计算强度
-    support_levels = cluster_levels_with_strength(all_supports, price_threshold, df)
-    resistance_levels = cluster_levels_with_strength(all_resistances, price_threshold, df)
+    support_levels = cluster_levels_with_strength(all_supports)
+    resistance_levels = cluster_levels_with_strength(all_resistances)
     
     return support_levels, resistance_levels
 
-@st.cache_data(ttl=43200, show_spinner=False)
-def get_stock_data(symbol, start_date, end_date):
-    """获取股票历史数据"""
+def format_levels(levels):
+    """将 (价格, 强度, 类型) 列表格式化为日志文本"""
+    return ', '.join(f"{price:.2f}({strength}/100)" for price, strength, _ in levels) or '无'
+
+def fetch_stock_history(symbol, start_date, end_date, adjust="qfq", wait_breaker=False):
+    """获取个股日线数据并转换为英文列名
+
+    wait_breaker 为True时接口熔断后等待恢复，用于批量获取
+    """
+    df = gateway.call('stock_zh_a_hist', symbol=symbol, 
+                          start_date=start_date.strftime('%Y%m%d'),
+                          end_date=end_date.strftime('%Y%m%d'),
+                          adjust=adjust, wait_breaker=wait_breaker)
+    if df.empty:
+        return pd.DataFrame(columns=['datetime'])
+    
+    # 重命名列
+    df = df.rename(columns={
+        '日期': 'datetime',
+        '开盘': 'Open',
+        '收盘': 'Close',
+        '最高': 'High',
+        '最低': 'Low',
+        '成交量': 'Volume',
+        '成交额': 'Amount',
+        '振幅': 'Amplitude',
+        '涨跌幅': 'Change',
+        '涨跌额': 'ChangeAmount',
+        '换手率': 'Turnover'
+    })
+    
+    # 转换日期列
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    return df
+
+def get_stock_data(symbol, start_date, end_date, indicators=None):
+    """获取股票历史数据
+
+    交易时段内缓存按 INTRADAY 策略分段 (盘中K线仍在变化)，休市时缓存到下一次开盘。
+    
+    Args:
+        symbol: 股票代码
+        start_date: 开始日期
+        end_date: 结束日期
+        indicators: 需要计算的指标列表或 INDICATOR_SETS 中的组合名，
+                    为None时计算全部指标 (见 utils.indicators)
+    """
+    return _get_stock_data(symbol, start_date, end_date, indicators, INTRADAY.expires_at())
+
+@st.cache_data(ttl=SESSION_CACHE_TTL, show_spinner=False)
+def _get_stock_data(symbol, start_date, end_date, indicators, expires_at):
     try:
         # 添加预热期
         WARMUP_DAYS = 30  # 技术指标预热期
         warmup_start_date = start_date - timedelta(days=WARMUP_DAYS)
         
-        # 获取包含预热期的股票历史数据
-        df = ak.stock_zh_a_hist(symbol=symbol, 
-                              start_date=warmup_start_date.strftime('%Y%m%d'),
-                              end_date=end_date.strftime('%Y%m%d'),
-                              adjust="qfq")
+        # 增量指标状态：已覆盖预热期起点时只获取最新K线，否则获取完整历史
+        # K线经本地存储读取，只向 akshare 请求本地缺失的日期区间
+        state = get_indicator_state(symbol, adjust="qfq", indicators=indicators)
+        warmup_start = pd.Timestamp(warmup_start_date).normalize()
+        today = pd.Timestamp(datetime.now().date())
+        
+        bars = None
+        # 检查、重置、追加与读取必须在同一把锁内完成，
+        # 否则并发请求的增量追加可能插入另一个请求的重置与全量追加之间
+        with state.lock:
+            if state.history_start is not None and state.history_start <= warmup_start:
+                # 从已有的最后一根K线开始获取，重叠部分用于检测复权价格变化
+                with timed('fetch'):
+                    bars = load_ohlcv(symbol, state.last_date, end_date, fetch_stock_history)
+                with timed('indicators'):
+                    state.update(bars[bars['datetime'] < today])
+            if state.history_start is None or state.history_start > warmup_start:
+                with timed('fetch'):
+                    bars = load_ohlcv(symbol, warmup_start_date, end_date, fetch_stock_history)
+                if bars.empty:
+                    return pd.DataFrame(), []
+                with timed('indicators'):
+                    state.reset()
+                    state.history_start = warmup_start
+                    state.update(bars[bars['datetime'] < today])
+        
+            # 当日K线盘中仍在变化，只计算不写入状态
+            df = state.frame()
+            live_bars = bars[bars['datetime'] >= today]
+            if not live_bars.empty:
+                with timed('indicators'):
+                    df = pd.concat([df, state.preview(live_bars)], ignore_index=True)
+        df = df[(df['datetime'] >= warmup_start) & (df['datetime'] <= pd.Timestamp(end_date))]
+        df = df.reset_index(drop=True)
         
         if df.empty:
             return pd.DataFrame(), []
-            
-        # 重命名列
-        df = df.rename(columns={
-            '日期': 'datetime',
-            '开盘': 'Open',
-            '收盘': 'Close',
-            '最高': 'High',
-            '最低': 'Low',
-            '成交量': 'Volume',
-            '成交额': 'Amount',
-            '振幅': 'Amplitude',
-            '涨跌幅': 'Change',
-            '涨跌额': 'ChangeAmount',
-            '换手率': 'Turnover'
-        })
-        
-        # 转换日期列
-        df['datetime'] = pd.to_datetime(df['datetime'])
-        
-        # 计算技术指标（使用完整数据包括预热期）
-        # 移动平均线
-        df['MA5'] = df['Close'].rolling(window=5).mean()
-        df['MA10'] = df['Close'].rolling(window=10).mean()
-        df['MA20'] = df['Close'].rolling(window=20).mean()
-        df['MA30'] = df['Close'].rolling(window=30).mean()
-        
-        # 乖离率(BIAS)
-        df['BIAS5'] = (df['Close'] - df['MA5']) / df['MA5'] * 100
-        df['BIAS10'] = (df['Close'] - df['MA10']) / df['MA10'] * 100
-        df['BIAS20'] = (df['Close'] - df['MA20']) / df['MA20'] * 100
-        
-        # 布林带
-        df['BB_MIDDLE'] = df['Close'].rolling(window=20).mean()
-        df['BB_UPPER'] = df['BB_MIDDLE'] + 2 * df['Close'].rolling(window=20).std()
-        df['BB_LOWER'] = df['BB_MIDDLE'] - 2 * df['Close'].rolling(window=20).std()
-        
-        # RSI
-        delta = df['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['RSI'] = 100 - (100 / (1 + rs))
-        
-        # MACD
-        exp1 = df['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = df['Close'].ewm(span=26, adjust=False).mean()
-        df['MACD'] = exp1 - exp2
-        df['Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-        df['MACD_Hist'] = df['MACD'] - df['Signal']
-        
-        # KDJ
-        low_min = df['Low'].rolling(window=9).min()
-        high_max = df['High'].rolling(window=9).max()
-        df['RSV'] = (df['Close'] - low_min) / (high_max - low_min) * 100
-        df['K'] = df['RSV'].rolling(window=3).mean()
-        df['D'] = df['K'].rolling(window=3).mean()
-        df['J'] = 3 * df['K'] - 2 * df['D']
 
         # 计算支撑位和压力位
-        print(f"\n开始计算支撑位和压力位...")
-        support_levels, resistance_levels = calculate_support_resistance(
-            df,
-            window=20,           # 增大窗口以找到更稳定的局部极值
-            price_threshold=0.02, # 增大价格聚类阈值以便于形成聚类
-            touch_count=2        # 降低触及次数要求
-        )
-        
-        print(f"初始计算结果:")
-        print(f"- 支撑位数量: {len(support_levels)}")
-        print(f"- 压力位数量: {len(resistance_levels)}")
-        if len(support_levels) > 0:
-            print(f"- 支撑位 (价格 | 强度分数):")
-            for price, strength in support_levels:
-                print(f"  - {round(price, 2)} | {strength}/100")
-        if len(resistance_levels) > 0:
-            print(f"- 压力位 (价格 | 强度分数):")
-            for price, strength in resistance_levels:
-                print(f"  - {round(price, 2)} | {strength}/100")
+        with timed('support_resistance'):
+            support_levels, resistance_levels = calculate_support_resistance(
+                df,
+                window=20,           # 增大窗口以找到更稳定的局部极值
+                price_threshold=0.02, # 增大价格聚类阈值以便于形成聚类
+                touch_count=2        # 降低触及次数要求
+            )
+        logger.debug("%s 初始计算结果: 支撑位 %s, 压力位 %s", symbol,
+                     format_levels(support_levels), format_levels(resistance_levels))
         
         # 过滤掉当前价格附近的支撑位和压力位
         current_price = df['Close'].iloc[-1]
         price_range = df['Close'].max() - df['Close'].min()
         threshold = price_range * 0.01  # 1% 的价格范围
 
-        print(f"\n过滤条件:")
-        print(f"- 当前价格: {round(current_price, 2)}")
-        print(f"- 价格范围: {round(price_range, 2)}")
-        print(f"- 过滤阈值: {round(threshold, 2)}")
-
         # 只保留当前价格上方的压力位和下方的支撑位
-        resistance_levels = [(price, strength) for price, strength in resistance_levels 
-                           if price > current_price + threshold]
-        support_levels = [(price, strength) for price, strength in support_levels 
-                         if price < current_price - threshold]
-
-        print(f"\n过滤后结果:")
-        print(f"- 支撑位数量: {len(support_levels)}")
-        print(f"- 压力位数量: {len(resistance_levels)}")
-        if len(support_levels) > 0:
-            print(f"- 支撑位 (价格 | 强度分数):")
-            for price, strength in support_levels:
-                print(f"  - {round(price, 2)} | {strength}/100")
-        if len(resistance_levels) > 0:
-            print(f"- 压力位 (价格 | 强度分数):")
-            for price, strength in resistance_levels:
-                print(f"  - {round(price, 2)} | {strength}/100")
+        resistance_levels = [level for level in resistance_levels 
+                           if level[0] > current_price + threshold]
+        support_levels = [level for level in support_levels 
+                         if level[0] < current_price - threshold]
 
         # 只保留最近的几个支撑位和压力位（按强度排序）
         resistance_levels = resistance_levels[:3] if resistance_levels else []
         support_levels = support_levels[-3:] if support_levels else []
 
-        print(f"\n最终结果:")
-        print(f"- 支撑位数量: {len(support_levels)}")
-        print(f"- 压力位数量: {len(resistance_levels)}")
-        if len(support_levels) > 0:
-            print(f"- 支撑位 (价格 | 强度分数):")
-            for price, strength in support_levels:
-                print(f"  - {round(price, 2)} | {strength}/100")
-        if len(resistance_levels) > 0:
-            print(f"- 压力位 (价格 | 强度分数):")
-            for price, strength in resistance_levels:
-                print(f"  - {round(price, 2)} | {strength}/100")
+        logger.debug("%s 最终结果 (当前价格 %.2f, 过滤阈值 %.2f): 支撑位 %s, 压力位 %s",
+                     symbol, current_price, threshold,
+                     format_levels(support_levels), format_levels(resistance_levels))
 
         # 转换为列表格式存储在DataFrame中
-        df['support_levels'] = [[price for price, _ in support_levels]] * len(df)
-        df['resistance_levels'] = [[price for price, _ in resistance_levels]] * len(df)
-        df['support_strengths'] = [[strength for _, strength in support_levels]] * len(df)
-        df['resistance_strengths'] = [[strength for _, strength in resistance_levels]] * len(df)
+        df['support_levels'] = [[price for price, _, _ in support_levels]] * len(df)
+        df['resistance_levels'] = [[price for price, _, _ in resistance_levels]] * len(df)
+        df['support_strengths'] = [[strength for _, strength, _ in support_levels]] * len(df)
+        df['resistance_strengths'] = [[strength for _, strength, _ in resistance_levels]] * len(df)
+        df['support_types'] = [[types for _, _, types in support_levels]] * len(df)
+        df['resistance_types'] = [[types for _, _, types in resistance_levels]] * len(df)
         
         # 移除预热期数据，只保留请求的日期范围
         df = df[df['datetime'] >= pd.Timestamp(start_date)]
@@ -567,5 +520,51 @@ def get_stock_data(symbol, start_date, end_date):
         return df, trade_cal
     
     except Exception as e:
-        print(f"Error getting stock data: {e}")
-        return pd.DataFrame(), [] 
\ No newline at end of file
+        logger.error("Error getting stock data: %s", e)
+        return pd.DataFrame(), [] 
+
+# 批量获取时所有线程共享的 akshare 限速器
+BATCH_RATE_LIMITER = RateLimiter(rate=5, burst=5)
+
+def get_stock_data_batch(symbols, start_date, end_date, indicators=None, max_workers=8,
+                         max_retries=3, as_panel=False):
+    """批量获取多只股票的历史数据并计算技术指标
+    
+    通过有界线程池并发获取，所有请求共享同一个限速器，单只股票失败时按指数退避重试。
+    只计算技术指标，不计算支撑压力位。
+    
+    Args:
+        symbols: 股票代码列表
+        start_date: 开始日期
+        end_date: 结束日期
+        indicators: 需要计算的指标列表或 INDICATOR_SETS 中的组合名，为None时计算全部指标
+        max_workers: 最大并发数
+        max_retries: 单只股票的最大尝试次数
+        as_panel: 为True时返回带 symbol 列的长表，否则返回 {symbol: DataFrame}
+    
+    Returns:
+        data: {symbol: DataFrame} 或长表 DataFrame
+        failures: {symbol: 错误信息}，包括获取失败和无数据的股票
+    """
+    WARMUP_DAYS = 30  # 技术指标预热期
+    warmup_start_date = start_date - timedelta(days=WARMUP_DAYS)
+    
+    def fetch_with_retry(symbol, start, end, adjust="qfq"):
+        return call_with_retry(fetch_stock_history, symbol, start, end, adjust=adjust, wait_breaker=True,
+                               max_retries=max_retries, limiter=BATCH_RATE_LIMITER)
+    
+    def load(symbol):
+        df = load_ohlcv(symbol, warmup_start_date, end_date, fetch_with_retry)
+        if df.empty:
+            raise ValueError("无数据")
+        df = compute_indicators(df, indicators)
+        return df[df['datetime'] >= pd.Timestamp(start_date)].reset_index(drop=True)
+    
+    results, errors = map_concurrent(load, list(dict.fromkeys(symbols)), max_workers=max_workers)
+    failures = {symbol: str(e) for symbol, e in errors.items()}
+    
+    if as_panel:
+        frames = [df.assign(symbol=symbol) for symbol, df in results.items()]
+        panel = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return panel, failures
+    return results, failures
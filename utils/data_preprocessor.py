@@ -1,11 +1,24 @@
-import akshare as ak
 import pandas as pd
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import partial
 import os
 import time
 from tqdm import tqdm
 
+from utils.concurrency import RateLimiter, call_with_retry, map_concurrent
+from utils.data_store import DATA_DIR, atomic_write
+from utils.datasets import bump_version
+from utils.gateway import gateway
+from utils.sector_history import record_snapshot, sector_history_path
+from utils.sector_matrix import SectorMatrix, sector_matrix_path
+from utils.sector_store import SectorStore, SectorStoreWriter, open_sector_store, sector_store_path
+
+# 增量模式下检查点的最长使用天数，超过后无论成分股数量是否变化都重新获取
+MAX_CHECKPOINT_AGE_DAYS = 7
+# 平盘与停牌股票不计入上涨+下跌家数，报告数量最多比实际成分股少这个比例
+FLAT_TOLERANCE = 0.2
+
 def get_data_with_retry(func, symbol, max_retries=3, retry_delay=2):
     """带重试机制的数据获取函数"""
     for attempt in range(max_retries):
@@ -18,20 +31,235 @@ def get_data_with_retry(func, symbol, max_retries=3, retry_delay=2):
             time.sleep(retry_delay)
             continue
 
-def preprocess_sector_data(test_mode=True):
+def fetch_board_members(func, board_names, desc, max_workers=1, rate=5, max_retries=3):
+    """获取一组板块的成分股
+
+    max_workers 为1时逐个串行获取；大于1时使用有界线程池并发获取，
+    所有线程共享一个令牌桶限速器，失败时按指数退避加随机抖动重试。
+
+    Args:
+        func: 成分股获取函数 func(symbol=板块名称)，如 partial(gateway.call, 'stock_board_industry_cons_em')
+        board_names: 板块名称列表
+        desc: 进度条描述
+        max_workers: 并发线程数
+        rate: 并发模式下每秒最多发出的请求数
+        max_retries: 最大尝试次数
+
+    Returns:
+        results: {板块名称: 成分股DataFrame}，按 board_names 顺序排列
+        failures: {板块名称: 异常}
+    """
+    results = {}
+    failures = {}
+    progress = tqdm(total=len(board_names), desc=desc)
+
+    if max_workers <= 1:
+        for name in board_names:
+            try:
+                results[name] = get_data_with_retry(func, name, max_retries=max_retries)
+            except Exception as e:
+                failures[name] = e
+            progress.update(1)
+    else:
+        limiter = RateLimiter(rate=rate, burst=max_workers)
+
+        def fetch(name):
+            try:
+                return call_with_retry(func, symbol=name, max_retries=max_retries, limiter=limiter)
+            finally:
+                progress.update(1)
+
+        results, failures = map_concurrent(fetch, board_names, max_workers=max_workers)
+
+    progress.close()
+    return results, failures
+
+def write_board_members(writer, kind, board_list, members, failures, label):
+    """按板块列表顺序将成分股写入数据库，kind 为 'industry' 或 'concept'
+
+    每写入一个板块即从 members 中移除其成分股，已写入的板块不再占用内存。
+    """
+    for board_name in board_list['板块名称']:
+        if board_name in failures:
+            print(f"\n处理{label} {board_name} 时出错: {str(failures[board_name])}")
+            continue
+        stocks = members.pop(board_name)
+        writer.add_board(kind, board_name, zip(stocks['代码'], stocks['名称']))
+
+def checkpoint_path(checkpoint_dir, kind, board_name):
+    """板块检查点文件路径，每个板块一个文件"""
+    safe_name = board_name.replace('/', '_').replace('\\', '_')
+    return os.path.join(checkpoint_dir, kind, f"{safe_name}.json")
+
+def write_json(path, obj):
+    """原子写入JSON文件"""
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False)
+    atomic_write(path, write)
+
+def read_checkpoint(checkpoint_dir, kind, board_name):
+    """读取板块检查点，不存在或损坏时返回None"""
+    path = checkpoint_path(checkpoint_dir, kind, board_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"读取检查点失败 {board_name}: {str(e)}")
+        return None
+
+def write_checkpoint(checkpoint_dir, kind, board_name, stocks, reported_count):
+    """保存单个板块的成分股检查点"""
+    write_json(checkpoint_path(checkpoint_dir, kind, board_name), {
+        'board': board_name,
+        'reported_count': reported_count,
+        'fetched_at': datetime.now().isoformat(),
+        'codes': stocks['代码'].tolist(),
+        'names': stocks['名称'].tolist(),
+    })
+
+def reported_member_count(board):
+    """板块列表接口报告的成分股数量 (近似值)
+
+    stock_board_*_name_em 只提供上涨家数和下跌家数 (不含平盘与停牌家数)，以两者之和
+    作为成分股数量的近似；缺少这两列时返回None，表示无法判断是否变化。
+    """
+    if '上涨家数' not in board or '下跌家数' not in board:
+        return None
+    count = board['上涨家数'] + board['下跌家数']
+    return None if pd.isna(count) else int(count)
+
+def checkpoint_is_current(checkpoint, reported_count, max_age_days=MAX_CHECKPOINT_AGE_DAYS):
+    """增量模式下判断检查点是否仍可使用 (启发式判断)
+
+    上涨家数 + 下跌家数 不含平盘与停牌股票，每天都会变化，不能与上一次的值比较，
+    而是与检查点中的实际成分股数量比较：
+    - 报告数量多于检查点成分股数量：一定有新成分股，重新获取
+    - 报告数量比检查点少 FLAT_TOLERANCE 以上：可能有成分股移出，重新获取
+    - 成分股替换而总数不变的情况无法发现，检查点超过 max_age_days 天后强制重新获取
+    """
+    if reported_count is None:
+        return False
+    fetched_at = datetime.fromisoformat(checkpoint['fetched_at'])
+    if datetime.now() - fetched_at > timedelta(days=max_age_days):
+        return False
+    member_count = len(checkpoint['codes'])
+    return member_count * (1 - FLAT_TOLERANCE) <= reported_count <= member_count
+
+def start_run(checkpoint_dir, resume):
+    """开始一次预处理运行，返回本次运行的起始时间
+
+    resume 为True且上一次运行未完成时沿用上一次的起始时间，
+    此后写入的检查点都视为已完成，不再重复获取。
+    """
+    run_path = os.path.join(checkpoint_dir, 'run.json')
+    if resume and os.path.exists(run_path):
+        with open(run_path, 'r', encoding='utf-8') as f:
+            run = json.load(f)
+        if not run.get('completed'):
+            print(f"从 {run['run_started']} 开始的预处理中断处继续")
+            return run['run_started']
+    run_started = datetime.now().isoformat()
+    write_json(run_path, {'run_started': run_started, 'completed': False})
+    return run_started
+
+def collect_board_members(kind, board_list, func, desc, checkpoint_dir, run_started,
+                          resume=False, incremental=False, max_workers=1, rate=5,
+                          max_checkpoint_age_days=MAX_CHECKPOINT_AGE_DAYS):
+    """获取一类板块的成分股，每个板块获取成功后立即写入检查点
+
+    Args:
+        kind: 'industry' 或 'concept'
+        board_list: stock_board_*_name_em 返回的板块列表
+        func: 成分股获取函数 func(symbol=板块名称)
+        desc: 进度条描述
+        checkpoint_dir: 检查点目录
+        run_started: 本次运行的起始时间
+        resume: 跳过本次运行中已写入检查点的板块
+        incremental: 跳过检查点仍可使用的板块 (启发式判断，见 checkpoint_is_current)
+        max_checkpoint_age_days: 增量模式下检查点的最长使用天数
+
+    获取失败的板块如果有检查点 (无论新旧)，沿用检查点中的成分股并记入 stale，
+    避免新的数据库缺少该板块，而归属历史仍保留其上一次的归属。
+
+    Returns:
+        members: {板块名称: 成分股DataFrame}，按板块列表顺序排列
+        failures: {板块名称: 异常}，只包括没有检查点可用的板块
+        reused: 直接使用检查点的板块数量
+        stale: {板块名称: 异常}，获取失败后沿用旧检查点的板块
+    """
+    board_names = board_list['板块名称'].tolist()
+    counts = {board['板块名称']: reported_member_count(board) for _, board in board_list.iterrows()}
+
+    def checkpoint_members(checkpoint):
+        return pd.DataFrame({'代码': checkpoint['codes'], '名称': checkpoint['names']})
+
+    checkpoints = {}
+    loaded = {}
+    to_fetch = []
+    for name in board_names:
+        checkpoint = read_checkpoint(checkpoint_dir, kind, name) if (resume or incremental) else None
+        loaded[name] = checkpoint
+        if checkpoint is not None and (
+            (resume and checkpoint['fetched_at'] >= run_started) or
+            (incremental and checkpoint_is_current(checkpoint, counts[name], max_checkpoint_age_days))
+        ):
+            checkpoints[name] = checkpoint_members(checkpoint)
+        else:
+            to_fetch.append(name)
+
+    def fetch_and_checkpoint(symbol):
+        # 只保留代码与名称，行情列不需要
+        stocks = func(symbol=symbol)[['代码', '名称']]
+        write_checkpoint(checkpoint_dir, kind, symbol, stocks, counts[symbol])
+        return stocks
+
+    if checkpoints:
+        print(f"复用 {len(checkpoints)} 个板块的检查点，需要获取 {len(to_fetch)} 个板块")
+    results, failures = fetch_board_members(fetch_and_checkpoint, to_fetch, desc,
+                                            max_workers=max_workers, rate=rate)
+
+    stale = {}
+    for name in list(failures):
+        checkpoint = loaded.get(name) or read_checkpoint(checkpoint_dir, kind, name)
+        if checkpoint is not None:
+            results[name] = checkpoint_members(checkpoint)
+            stale[name] = failures.pop(name)
+
+    members = {name: checkpoints.get(name, results.get(name)) for name in board_names
+               if name in checkpoints or name in results}
+    return members, failures, len(checkpoints), stale
+
+def preprocess_sector_data(test_mode=True, max_workers=1, rate=5, resume=False, incremental=False,
+                           max_checkpoint_age_days=MAX_CHECKPOINT_AGE_DAYS):
     """
     预处理板块数据，将数据保存为易于查询的格式
     test_mode: 如果为True，只处理少量数据进行测试
+    max_workers: 并发获取成分股的线程数，为1时逐个串行获取
+    rate: 并发模式下每秒最多发出的请求数
+    resume: 从上一次中断的运行继续，跳过已获取的板块
+    incremental: 只重新获取成分股数量可能变化的板块，其余板块使用检查点。
+                 数量变化按上涨+下跌家数估计，只是启发式判断
+    max_checkpoint_age_days: 增量模式下检查点超过该天数后强制重新获取
+    
+    每个板块获取成功后立即写入 data/sector_checkpoint 下的检查点文件。
+    并发模式下获取完成后仍按板块列表顺序合并结果，输出与串行模式一致。
+    成分股逐个板块写入数据库，不在内存中构建完整的股票→板块映射；
+    归属矩阵与归属历史随后从数据库逐批读取生成。
+
+    Returns:
+        dict: {'metadata': 元数据 (含 total_stocks), 'path': 数据库路径}，失败时返回None
     """
     start_time = time.time()
     
     # 创建数据目录
-    data_dir = "data"
+    data_dir = DATA_DIR
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
+    checkpoint_dir = os.path.join(data_dir, 'sector_checkpoint_test' if test_mode else 'sector_checkpoint')
     
-    # 初始化数据结构 - 只存储股票到板块的映射
-    stock_sectors = {}  # 股票所属板块信息
     metadata = {
         'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'test_mode': test_mode,
@@ -40,10 +268,15 @@ def preprocess_sector_data(test_mode=True):
         'processing_time': 0
     }
     
+    filepath = sector_store_path(test_mode, data_dir)
+    writer = None
     try:
+        run_started = start_run(checkpoint_dir, resume)
+        writer = SectorStoreWriter(filepath)
+        
         # 处理行业板块
         print("\n开始获取行业板块列表...")
-        industry_list = ak.stock_board_industry_name_em()
+        industry_list = gateway.call('stock_board_industry_name_em', ttl=0)
         
         # 测试模式下只处理前3个行业
         if test_mode:
@@ -53,33 +286,20 @@ def preprocess_sector_data(test_mode=True):
         metadata['total_industries'] = total_industries
         print(f"共找到 {total_industries} 个行业板块")
         
-        # 使用tqdm创建进度条
-        for idx, (_, industry) in enumerate(tqdm(industry_list.iterrows(), total=total_industries, desc="处理行业板块")):
-            industry_name = industry['板块名称']
-            
-            try:
-                # 获取行业成分股（带重试机制）
-                stocks = get_data_with_retry(ak.stock_board_industry_cons_em, industry_name)
-                
-                # 更新股票所属板块信息
-                for _, stock in stocks.iterrows():
-                    code = stock['代码']
-                    if code not in stock_sectors:
-                        stock_sectors[code] = {
-                            'name': stock['名称'],
-                            'industry': [],
-                            'concept': []
-                        }
-                    if industry_name not in stock_sectors[code]['industry']:
-                        stock_sectors[code]['industry'].append(industry_name)
-                
-            except Exception as e:
-                print(f"\n处理行业 {industry_name} 时出错: {str(e)}")
-                continue
+        # 获取行业成分股（带重试机制）
+        industry_members, industry_failures, industry_reused, industry_stale = collect_board_members(
+            'industry', industry_list, partial(gateway.call, 'stock_board_industry_cons_em', ttl=0, wait_breaker=True), "处理行业板块",
+            checkpoint_dir, run_started, resume=resume, incremental=incremental,
+            max_checkpoint_age_days=max_checkpoint_age_days,
+            max_workers=max_workers, rate=rate
+        )
+        
+        # 按板块列表顺序写入数据库，写入后释放行业成分股，再获取概念板块
+        write_board_members(writer, 'industry', industry_list, industry_members, industry_failures, '行业')
         
         # 处理概念板块
         print("\n开始获取概念板块列表...")
-        concept_list = ak.stock_board_concept_name_em()
+        concept_list = gateway.call('stock_board_concept_name_em', ttl=0)
         
         # 测试模式下只处理前5个概念
         if test_mode:
@@ -89,69 +309,104 @@ def preprocess_sector_data(test_mode=True):
         metadata['total_concepts'] = total_concepts
         print(f"共找到 {total_concepts} 个概念板块")
         
-        # 使用tqdm创建进度条
-        for idx, (_, concept) in enumerate(tqdm(concept_list.iterrows(), total=total_concepts, desc="处理概念板块")):
-            concept_name = concept['板块名称']
-            
-            try:
-                # 获取概念成分股（带重试机制）
-                stocks = get_data_with_retry(ak.stock_board_concept_cons_em, concept_name)
-                
-                # 更新股票所属板块信息
-                for _, stock in stocks.iterrows():
-                    code = stock['代码']
-                    if code not in stock_sectors:
-                        stock_sectors[code] = {
-                            'name': stock['名称'],
-                            'industry': [],
-                            'concept': []
-                        }
-                    if concept_name not in stock_sectors[code]['concept']:
-                        stock_sectors[code]['concept'].append(concept_name)
-                
-            except Exception as e:
-                print(f"\n处理概念 {concept_name} 时出错: {str(e)}")
-                continue
+        # 获取概念成分股（带重试机制）
+        concept_members, concept_failures, concept_reused, concept_stale = collect_board_members(
+            'concept', concept_list, partial(gateway.call, 'stock_board_concept_cons_em', ttl=0, wait_breaker=True), "处理概念板块",
+            checkpoint_dir, run_started, resume=resume, incremental=incremental,
+            max_checkpoint_age_days=max_checkpoint_age_days,
+            max_workers=max_workers, rate=rate
+        )
+        
+        # 按板块列表顺序写入数据库
+        write_board_members(writer, 'concept', concept_list, concept_members, concept_failures, '概念')
+        
+        # 记录沿用旧检查点的板块，便于确认数据库中哪些板块不是本次获取的
+        metadata['stale_boards'] = list(industry_stale) + list(concept_stale)
         
         # 计算处理时间
         processing_time = time.time() - start_time
         metadata['processing_time'] = f"{processing_time:.2f}秒"
+        metadata['total_stocks'] = writer.stock_count
         
-        # 保存数据到文件
+        # 写入元数据并替换数据库文件
+        writer.metadata.update(metadata)
+        writer.commit()
         data = {
             'metadata': metadata,
-            'stocks': stock_sectors
+            'path': filepath
         }
         
-        filename = 'sector_data_test.json' if test_mode else 'sector_data.json'
-        filepath = os.path.join(data_dir, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # 归属矩阵与归属历史从数据库逐批读取生成；获取失败的板块在历史中沿用上一次的归属
+        keep_sectors = ([('industry', name) for name in industry_failures] +
+                        [('concept', name) for name in concept_failures])
+        store = SectorStore(filepath)
+        try:
+            SectorMatrix.from_memberships(store.iter_memberships()).save(sector_matrix_path(test_mode, data_dir))
+            changes = record_snapshot(store.iter_memberships(), path=sector_history_path(test_mode, data_dir),
+                                      keep_sectors=keep_sectors)
+        finally:
+            store.close()
         
         print(f"\n数据处理完成，已保存到 {filepath}")
         print(f"处理了 {metadata['total_industries']} 个行业和 {metadata['total_concepts']} 个概念")
-        print(f"共收集了 {len(stock_sectors)} 只股票的板块信息")
+        print(f"共收集了 {metadata['total_stocks']} 只股票的板块信息")
         print(f"处理用时: {metadata['processing_time']}")
+        if changes:
+            print(f"归属变化: 新增 {changes['added']} 条，移除 {changes['removed']} 条")
+        
+        # 显示抓取吞吐量与失败情况
+        reused = industry_reused + concept_reused
+        fetched = total_industries + total_concepts - reused
+        failures = {**industry_failures, **concept_failures}
+        stale = {**industry_stale, **concept_stale}
+        print(f"获取 {fetched} 个板块，复用检查点 {reused} 个板块")
+        if stale:
+            print(f"获取失败、沿用旧检查点 {len(stale)} 个板块: {', '.join(stale)}")
+        print(f"抓取吞吐量: {fetched / processing_time:.2f} 个板块/秒 (并发线程数: {max_workers})")
+        if failures:
+            print(f"失败板块 {len(failures)} 个: {', '.join(failures)}")
+        else:
+            print("失败板块: 无")
         
         # 显示数据大小
         file_size = os.path.getsize(filepath) / 1024  # KB
         print(f"数据文件大小: {file_size:.2f} KB")
         
+        # 数据文件已替换完成，递增版本号通知运行中的应用重新加载
+        if not test_mode:
+            bump_version('sectors', os.path.join(data_dir, 'versions.json'), stocks=metadata['total_stocks'])
+        
+        # 所有板块处理完毕，之后的 resume 将开始新的运行
+        write_json(os.path.join(checkpoint_dir, 'run.json'), {'run_started': run_started, 'completed': True})
+        
         return data
         
     except Exception as e:
+        if writer is not None:
+            writer.abort()
         print(f"数据预处理失败: {str(e)}")
         return None
 
-def load_sector_data(test_mode=True):
-    """加载预处理的板块数据"""
-    filename = 'sector_data_test.json' if test_mode else 'sector_data.json'
-    filepath = os.path.join('data', filename)
-    
+def load_sector_data(test_mode=True, code=None):
+    """加载预处理的板块数据
+
+    Args:
+        test_mode: 是否读取测试数据
+        code: 股票代码；指定时只按索引查询这一只股票，不加载全部数据
+
+    Returns:
+        code 为None时返回 {股票代码: {'name', 'industry', 'concept'}}，
+        否则返回该股票的 {'name', 'industry', 'concept'} (未找到时为None)
+    """
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data['stocks']  # 只返回股票数据部分
+        store = open_sector_store(test_mode)
+        if store is None:
+            print(f"加载数据失败: 找不到数据文件 {sector_store_path(test_mode)}")
+            return None
+        try:
+            return store.to_dict() if code is None else store.get_stock(code)
+        finally:
+            store.close()
     except Exception as e:
         print(f"加载数据失败: {str(e)}")
         return None
@@ -164,7 +419,11 @@ if __name__ == "__main__":
     if data:
         # 测试数据查询
         print("\n测试数据查询:")
-        # 随机选择一个股票进行测试
-        test_stock = list(data['stocks'].keys())[0]
+        # 选择第一只股票进行测试
+        store = SectorStore(data['path'])
+        try:
+            test_stock = store.list_stocks()[0][0]
+        finally:
+            store.close()
         print(f"\n股票 {test_stock} 的板块信息:")
-        print(json.dumps(data['stocks'][test_stock], ensure_ascii=False, indent=2)) 
\ No newline at end of file
+        print(json.dumps(load_sector_data(test_mode=True, code=test_stock), ensure_ascii=False, indent=2)) 
\ No newline at end of file
@@ -0,0 +1,235 @@
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.instrumentation import get_logger
+
+logger = get_logger('data_store')
+
+# 在线运行使用的本地数据根目录
+LIVE_DATA_DIR = 'data'
+# 录制/回放数据后端的录制目录 (见 utils.backend)
+RECORDINGS_DIR = os.environ.get('STOCK_ANALYZER_RECORDINGS', os.path.join(LIVE_DATA_DIR, 'recordings'))
+
+
+def backend_mode():
+    """数据后端模式 (STOCK_ANALYZER_BACKEND)：live / record / replay"""
+    return os.environ.get('STOCK_ANALYZER_BACKEND', 'live').lower()
+
+
+def replay_data_dir(recordings_dir=RECORDINGS_DIR):
+    """回放模式的本地数据根目录"""
+    return os.path.join(recordings_dir, 'replay_data')
+
+
+def resolve_data_dir():
+    """本地数据根目录
+
+    回放模式 (STOCK_ANALYZER_BACKEND=replay) 下检查点、数据集与版本号
+    都放在录制目录下的独立根目录中，回放得到的数据不会写入在线运行使用的 data 目录。
+    """
+    if backend_mode() == 'replay':
+        return replay_data_dir()
+    return LIVE_DATA_DIR
+
+
+DATA_DIR = resolve_data_dir()
+# 录制与回放模式不读写本地K线存储：录制时每次请求完整的区间，录制结果才包含应用用到的全部K线；
+# 回放时按请求区间从录制的K线中截取 (见 utils.backend.ReplayBackend)，结果不依赖本地存储的状态
+BAR_STORE_ENABLED = backend_mode() == 'live'
+
+# 本地K线存储目录：每只股票每种复权方式一个 Parquet 文件，
+# 同名 .json 文件记录已获取过的日期区间
+STORE_DIR = os.path.join(DATA_DIR, 'store', 'ohlcv')
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def get_store_lock(key):
+    """获取某个存储文件的线程锁"""
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def store_paths(symbol, adjust='qfq'):
+    """返回 (数据文件路径, 区间元数据路径)"""
+    folder = os.path.join(STORE_DIR, adjust or 'none')
+    return os.path.join(folder, f"{symbol}.parquet"), os.path.join(folder, f"{symbol}.json")
+
+
+def make_temp_path(path):
+    """在目标文件同目录下创建唯一的临时文件 (mkstemp)，返回其路径"""
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    os.close(fd)
+    return tmp_path
+
+
+def replace_from_temp(tmp_path, path):
+    """用写好的临时文件原子替换目标文件"""
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def remove_temp(tmp_path):
+    """删除写入失败的临时文件"""
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+def atomic_write(path, write):
+    """先写入临时文件再原子替换，避免读取到写了一半的文件
+
+    临时文件名唯一 (同目录下 mkstemp)，多个进程或线程同时写同一文件时
+    不会互相删除或覆盖对方的临时文件，最后完成的一方生效。
+    """
+    tmp_path = make_temp_path(path)
+    try:
+        write(tmp_path)
+        replace_from_temp(tmp_path, path)
+    except BaseException:
+        remove_temp(tmp_path)
+        raise
+
+
+def merge_ranges(ranges):
+    """合并重叠或相邻 (间隔不超过1天) 的日期区间"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(ranges, start, end):
+    """计算 [start, end] 中尚未覆盖的日期区间"""
+    gaps = []
+    cursor = start
+    for range_start, range_end in merge_ranges(ranges):
+        if range_end < cursor:
+            continue
+        if range_start > end:
+            break
+        if range_start > cursor:
+            gaps.append((cursor, range_start - timedelta(days=1)))
+        cursor = max(cursor, range_end + timedelta(days=1))
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def read_store(symbol, adjust='qfq'):
+    """读取本地存储的K线与已覆盖区间"""
+    data_path, meta_path = store_paths(symbol, adjust)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return pd.DataFrame(), []
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        ranges = [[pd.Timestamp(s), pd.Timestamp(e)] for s, e in meta['ranges']]
+        return pd.read_parquet(data_path), ranges
+    except Exception as e:
+        logger.warning("读取本地K线存储失败 %s: %s", symbol, e)
+        return pd.DataFrame(), []
+
+
+def write_store(symbol, df, ranges, adjust='qfq'):
+    """写入K线与已覆盖区间，数据文件先于元数据写入"""
+    data_path, meta_path = store_paths(symbol, adjust)
+    meta = {
+        'symbol': symbol,
+        'adjust': adjust,
+        'ranges': [[s.strftime('%Y-%m-%d'), e.strftime('%Y-%m-%d')] for s, e in merge_ranges(ranges)],
+        'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+    def write_meta(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    atomic_write(data_path, lambda path: df.to_parquet(path, index=False))
+    atomic_write(meta_path, write_meta)
+
+
+def load_ohlcv(symbol, start_date, end_date, fetch, adjust='qfq'):
+    """从本地存储读取K线，只向数据源获取缺失的日期区间
+
+    当日及之后的K线可能尚未收盘，每次都重新获取且不写入存储。
+    录制与回放模式下不使用本地存储，直接获取整个请求区间 (见 BAR_STORE_ENABLED)。
+    补齐缺口时会多取缺口两侧各一根已存储的K线，若其收盘价与存储不一致
+    (前复权因子发生变化)，则丢弃本地数据并重新获取整个请求区间。
+
+    Args:
+        symbol: 股票代码
+        start_date: 开始日期
+        end_date: 结束日期
+        fetch: 数据获取函数 fetch(symbol, start_date, end_date, adjust=adjust)，
+               返回含 datetime 列的DataFrame
+        adjust: 复权方式
+
+    Returns:
+        DataFrame: [start_date, end_date] 范围内的K线，按日期升序
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    if not BAR_STORE_ENABLED:
+        df = fetch(symbol, start, end, adjust=adjust)
+        return df[(df['datetime'] >= start) & (df['datetime'] <= end)].reset_index(drop=True)
+
+    today = pd.Timestamp(datetime.now().date())
+    stored_end = min(end, today - timedelta(days=1))
+
+    with get_store_lock((symbol, adjust)):
+        stored, ranges = read_store(symbol, adjust)
+        gaps = missing_ranges(ranges, start, stored_end) if start <= stored_end else []
+        if end >= today:
+            # 当日K线与最后一个缺口合并为一次请求
+            if gaps and gaps[-1][1] == stored_end:
+                gaps[-1] = (gaps[-1][0], end)
+            else:
+                gaps.append((max(start, today), end))
+
+        frames = [stored]
+        new_ranges = list(ranges)
+        stale = False
+        for gap_start, gap_end in gaps:
+            # 多取缺口两侧已存储的K线作为校验锚点
+            before = stored[stored['datetime'] < gap_start].tail(1) if not stored.empty else stored
+            after = stored[stored['datetime'] > gap_end].head(1) if not stored.empty else stored
+            fetch_start = before['datetime'].iloc[0] if not before.empty else gap_start
+            fetch_end = after['datetime'].iloc[0] if not after.empty else gap_end
+
+            bars = fetch(symbol, fetch_start, fetch_end, adjust=adjust)
+            anchors = pd.concat([before, after])
+            if not anchors.empty and not bars.empty:
+                check = anchors.merge(bars[['datetime', 'Close']], on='datetime', suffixes=('', '_new'))
+                if ((check['Close'] - check['Close_new']).abs() > 1e-6).any():
+                    stale = True
+                    break
+            frames.append(bars)
+            if gap_start <= stored_end:
+                new_ranges.append([gap_start, min(gap_end, stored_end)])
+
+        if stale:
+            # 复权价格已变化，本地数据全部作废，重新获取整个请求区间
+            frames = [fetch(symbol, start, end, adjust=adjust)]
+            new_ranges = [[start, stored_end]] if start <= stored_end else []
+
+        frames = [f for f in frames if not f.empty]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['datetime'])
+        if not df.empty:
+            df = df.drop_duplicates('datetime', keep='last').sort_values('datetime', ignore_index=True)
+
+        if stale or merge_ranges(new_ranges) != merge_ranges(ranges):
+            write_store(symbol, df[df['datetime'] < today].reset_index(drop=True),
+                        new_ranges, adjust)
+
+    return df[(df['datetime'] >= start) & (df['datetime'] <= end)].reset_index(drop=True)
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from utils.data_store import DATA_DIR, atomic_write
+from utils.gateway import gateway
+from utils.instrumentation import get_logger
+
+logger = get_logger('datasets')
+
+# 由后台刷新程序维护的数据集。每个数据集替换完成后在 versions.json 中递增版本号，
+# 应用进程以版本号作为缓存键，版本变化时自动重新加载，无需重启
+VERSIONS_FILE = os.path.join(DATA_DIR, 'versions.json')
+DATASET_FILES = {
+    'sectors': ['sector_data.db', 'sector_matrix.npz'],
+    'stock_list': ['stock_list.parquet'],
+    'trade_calendar': ['trade_calendar.parquet'],
+}
+
+_versions_lock = threading.Lock()
+_versions_cache = {'mtime': None, 'versions': {}}
+
+
+def dataset_path(name, data_dir=DATA_DIR):
+    """数据集主文件路径"""
+    return os.path.join(data_dir, DATASET_FILES[name][0])
+
+
+def read_versions(path=VERSIONS_FILE):
+    """读取全部数据集的版本信息，文件未变化时直接返回上次的结果"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _versions_lock:
+        if _versions_cache['mtime'] != mtime:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    _versions_cache['versions'] = json.load(f)
+                _versions_cache['mtime'] = mtime
+            except Exception as e:
+                logger.warning("读取数据集版本失败: %s", e)
+                return _versions_cache['versions']
+        return _versions_cache['versions']
+
+
+def dataset_version(name, path=VERSIONS_FILE):
+    """数据集当前的版本号，未记录过时为0"""
+    return read_versions(path).get(name, {}).get('version', 0)
+
+
+def bump_version(name, path=VERSIONS_FILE, **info):
+    """数据集替换完成后递增版本号，info 为附加记录的信息 (如行数)"""
+    with _versions_lock:
+        versions = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                versions = json.load(f)
+        entry = versions.get(name, {})
+        versions[name] = {
+            **info,
+            'version': entry.get('version', 0) + 1,
+            'updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+        def write(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(versions, f, ensure_ascii=False, indent=2)
+
+        atomic_write(path, write)
+        return versions[name]['version']
+
+
+def write_frame(path, df):
+    """原子写入 Parquet 文件"""
+    atomic_write(path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+
+
+def refresh_stock_list(data_dir=DATA_DIR):
+    """刷新A股代码与名称列表"""
+    df = gateway.call('stock_info_a_code_name', ttl=0)[['code', 'name']]
+    write_frame(dataset_path('stock_list', data_dir), df)
+    return bump_version('stock_list', os.path.join(data_dir, 'versions.json'), rows=len(df))
+
+
+def refresh_trade_calendar(data_dir=DATA_DIR):
+    """刷新交易日历"""
+    df = gateway.call('tool_trade_date_hist_sina', ttl=0)
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    write_frame(dataset_path('trade_calendar', data_dir), df[['trade_date']])
+    return bump_version('trade_calendar', os.path.join(data_dir, 'versions.json'), rows=len(df))
+
+
+def load_dataset(name, data_dir=DATA_DIR):
+    """读取 Parquet 数据集，文件不存在时返回None"""
+    path = dataset_path(name, data_dir)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
@@ -0,0 +1,257 @@
+import functools
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+
+from utils.backend import create_backend
+from utils.instrumentation import get_logger
+from utils.market_session import DAILY, INTRADAY, REALTIME
+from utils.resilience import UpstreamGuard
+
+logger = get_logger('gateway')
+
+# 各接口结果的软过期时间：秒数 (0 表示不缓存，只合并同时发出的相同请求)，
+# 或按交易时段计算有效期的 SessionPolicy (见 utils.market_session)。
+# K线历史由本地存储负责增量获取，网关不再缓存
+ENDPOINT_TTLS = {
+    'stock_zh_index_spot': REALTIME,
+    'stock_board_industry_name_em': INTRADAY,
+    'stock_board_concept_name_em': INTRADAY,
+    'stock_board_industry_hist_em': DAILY,
+    'stock_board_industry_cons_em': INTRADAY,
+    'stock_board_concept_cons_em': INTRADAY,
+    'stock_zh_a_spot_em': REALTIME,
+    'stock_info_a_code_name': DAILY,
+    'tool_trade_date_hist_sina': DAILY,
+    'stock_zh_a_hist': 0,
+    'stock_zh_index_daily_em': 0,
+}
+DEFAULT_TTL = 0
+# 硬过期时间 = 软过期时间 × HARD_TTL_MULTIPLE。
+# 软过期后先返回旧值并在后台刷新；硬过期后必须等待重新获取
+HARD_TTL_MULTIPLE = 4
+
+
+def copy_value(value):
+    """DataFrame/Series (包括元组中的) 返回副本，调用方修改不会影响缓存"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(copy_value(item) for item in value)
+    return value
+
+
+def hashable(value):
+    """把参数中的列表转换为元组，用作缓存键"""
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(item) for item in value)
+    return value
+
+
+def resolve_ttl(ttl):
+    """秒数原样返回，SessionPolicy 按当前时间计算有效秒数"""
+    return ttl.ttl() if hasattr(ttl, 'ttl') else ttl
+
+
+class SWRCache:
+    """支持 stale-while-revalidate 的进程内缓存
+
+    - 软过期前：直接返回缓存值
+    - 软过期后、硬过期前：立即返回旧值，并在后台线程刷新 (同一个键只刷新一次)
+    - 硬过期后或没有缓存：同步获取，同时发出的相同请求只获取一次
+    - 获取失败时若有旧值 (无论是否已硬过期)，返回旧值而不是抛出异常
+    """
+
+    def __init__(self):
+        self.entries = {}    # 键 -> (值, 获取时间, 软过期秒数, 硬过期秒数)
+        self.inflight = {}   # 键 -> Future
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def _count(self, group, field):
+        counters = self.counters.setdefault(group, {
+            'hits': 0, 'stale': 0, 'misses': 0, 'coalesced': 0, 'errors': 0, 'fallbacks': 0
+        })
+        counters[field] += 1
+
+    def _load(self, key, group, loader, ttl, hard_ttl, future):
+        """执行获取并唤醒等待同一结果的调用方"""
+        try:
+            value = loader()
+        except Exception as e:
+            with self.lock:
+                self._count(group, 'errors')
+                del self.inflight[key]
+            future.set_exception(e)
+            return
+        # 有效期按获取完成的时间计算 (休市时获取的数据可以缓存到下一次开盘)
+        soft = resolve_ttl(ttl)
+        hard = soft * HARD_TTL_MULTIPLE if hard_ttl is None else max(hard_ttl, soft)
+        with self.lock:
+            if soft > 0:
+                self.entries[key] = (value, time.time(), soft, hard)
+            del self.inflight[key]
+        future.set_result(value)
+
+    def _refresh_in_background(self, key, group, loader, ttl, hard_ttl, future):
+        self._load(key, group, loader, ttl, hard_ttl, future)
+        error = future.exception()
+        if error is not None:
+            logger.warning("后台刷新 %s 失败，继续使用旧值: %s", group, error)
+
+    def get(self, key, loader, ttl, hard_ttl=None, group=None):
+        """读取缓存，必要时调用 loader() 获取
+
+        Args:
+            key: 缓存键 (需可哈希)
+            loader: 无参数的获取函数
+            ttl: 软过期秒数 (0 表示不缓存) 或 SessionPolicy
+            hard_ttl: 硬过期秒数，默认软过期秒数 × HARD_TTL_MULTIPLE
+            group: 统计分组名
+
+        Returns:
+            缓存值或新获取的值 (DataFrame 为副本)
+        """
+        group = group or key[0]
+
+        with self.lock:
+            entry = self.entries.get(key)
+            age = time.time() - entry[1] if entry is not None else None
+            if entry is not None and age < entry[2]:
+                self._count(group, 'hits')
+                return copy_value(entry[0])
+
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.inflight[key] = future
+
+            if entry is not None and age < entry[3]:
+                # 软过期：返回旧值，后台刷新
+                self._count(group, 'stale')
+                if leader:
+                    threading.Thread(target=self._refresh_in_background,
+                                     args=(key, group, loader, ttl, hard_ttl, future), daemon=True).start()
+                return copy_value(entry[0])
+
+            self._count(group, 'misses' if leader else 'coalesced')
+
+        if leader:
+            self._load(key, group, loader, ttl, hard_ttl, future)
+        try:
+            return copy_value(future.result())
+        except Exception as e:
+            if entry is None:
+                raise
+            with self.lock:
+                self._count(group, 'fallbacks')
+            logger.warning("获取 %s 失败，返回旧值: %s", group, e)
+            return copy_value(entry[0])
+
+    def invalidate(self, group=None):
+        """清除缓存值，group 为None时清除全部"""
+        with self.lock:
+            if group is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if key[0] == group]:
+                    del self.entries[key]
+
+    def stats(self):
+        """各分组的命中、旧值、未命中、合并、失败、回退次数与当前缓存条目数"""
+        with self.lock:
+            cached = {}
+            for key in self.entries:
+                cached[key[0]] = cached.get(key[0], 0) + 1
+            rows = [{'endpoint': group, **counters, 'cached': cached.get(group, 0)}
+                    for group, counters in self.counters.items()]
+        columns = ['endpoint', 'hits', 'stale', 'misses', 'coalesced', 'errors', 'fallbacks', 'cached']
+        return pd.DataFrame(rows, columns=columns).sort_values('endpoint', ignore_index=True)
+
+
+class AkshareGateway:
+    """所有 akshare 调用的统一入口
+
+    请求按 (接口名, 参数) 作为键：
+    - 同一个键只保留一份结果，所有调用方共享 (返回副本，调用方可以修改)
+    - 多个会话同时发出相同请求时只发出一次网络调用，其余调用等待同一结果
+    - 软过期后立即返回旧值并在后台刷新，接口报错时回退到旧值
+    - 按接口统计命中、未命中、合并与失败次数
+    - 实际请求交给数据后端 (在线、录制或回放，见 utils.backend)
+    - 请求受耗时上限、熔断与对冲保护 (见 utils.resilience)，
+      超时或熔断时由缓存回退到旧值
+
+    Args:
+        ttls: {接口名: 软过期秒数或 SessionPolicy}，默认 ENDPOINT_TTLS
+        cache: 使用的 SWRCache，默认新建
+        backend: 数据后端，默认按环境变量创建
+        guard: UpstreamGuard，默认新建
+    """
+
+    def __init__(self, ttls=None, cache=None, backend=None, guard=None):
+        self.ttls = dict(ENDPOINT_TTLS if ttls is None else ttls)
+        self.cache = cache or SWRCache()
+        self.backend = backend or create_backend()
+        self.guard = guard or UpstreamGuard()
+
+    def set_backend(self, backend):
+        """切换数据后端并清除缓存，避免混用不同后端的结果"""
+        self.backend = backend
+        self.cache.invalidate()
+
+    def call(self, endpoint, *args, ttl=None, hard_ttl=None, wait_breaker=False, **kwargs):
+        """调用 akshare 接口
+
+        Args:
+            endpoint: akshare 函数名，如 'stock_board_industry_name_em'
+            ttl: 覆盖该接口默认的软过期秒数或 SessionPolicy
+            hard_ttl: 覆盖硬过期秒数
+            wait_breaker: 接口熔断时等待恢复而不是立即失败，用于预处理、批量K线等
+                          不依赖缓存回退的批量获取
+            其余参数原样传给 akshare 函数 (需可哈希)
+
+        Returns:
+            接口返回值；没有旧值可回退时，接口抛出的异常原样抛出
+        """
+        ttl = self.ttls.get(endpoint, DEFAULT_TTL) if ttl is None else ttl
+        key = (endpoint, args, tuple(sorted(kwargs.items())))
+        fetch = lambda: self.guard.call(self.backend, endpoint, *args, wait_breaker=wait_breaker, **kwargs)
+        return self.cache.get(key, fetch, ttl, hard_ttl)
+
+    def invalidate(self, endpoint=None):
+        """清除缓存结果，endpoint 为None时清除全部"""
+        self.cache.invalidate(endpoint)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+# 网关与派生数据加载函数共用一个缓存，统计显示在同一张表中
+cache = SWRCache()
+gateway = AkshareGateway(cache=cache)
+
+
+def swr_cached(ttl, hard_ttl=None):
+    """为加载函数添加 stale-while-revalidate 缓存的装饰器
+
+    用于在 akshare 结果之上做了计算的加载函数 (如市场概览)，
+    软过期后立即返回上一次的结果并在后台重新计算，计算失败时返回旧值。
+
+    Args:
+        ttl: 软过期秒数或 SessionPolicy
+        hard_ttl: 硬过期秒数
+    """
+    def decorator(func):
+        group = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (group, hashable(args), hashable(tuple(sorted(kwargs.items()))))
+            return cache.get(key, lambda: func(*args, **kwargs), ttl, hard_ttl, group)
+
+        wrapper.invalidate = lambda: cache.invalidate(group)
+        return wrapper
+    return decorator
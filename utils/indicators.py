@@ -0,0 +1,252 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# 指标定义：name 为输出列名，inputs 为依赖的原始列或其他指标，
+# func 以依赖序列为位置参数、params 为关键字参数计算结果，
+# intermediate 为 True 的指标只作为共享中间结果，不写入输出，
+# lookback 为计算单个值时需要回看的历史K线数量 (不含当前K线)
+Indicator = namedtuple('Indicator', ['name', 'inputs', 'func', 'params', 'intermediate', 'lookback'])
+
+INDICATORS = {}
+
+
+def register_indicator(name, inputs, func, intermediate=False, lookback=None, **params):
+    """注册一个指标，重复注册会覆盖同名定义
+
+    lookback 未指定时按 window 参数推断 (window - 1)，无 window 参数则为0
+    """
+    if lookback is None:
+        lookback = params.get('window', 1) - 1
+    INDICATORS[name] = Indicator(name, tuple(inputs), func, params, intermediate, lookback)
+
+
+# 基础计算函数，输入可以是单只股票的Series，也可以是 日期×股票 的DataFrame
+def rolling_mean(series, window):
+    return series.rolling(window=window).mean()
+
+
+def rolling_std(series, window):
+    return series.rolling(window=window).std()
+
+
+def rolling_min(series, window):
+    return series.rolling(window=window).min()
+
+
+def rolling_max(series, window):
+    return series.rolling(window=window).max()
+
+
+def ema(series, span):
+    return series.ewm(span=span, adjust=False).mean()
+
+
+def diff(series):
+    return series.diff()
+
+
+def subtract(a, b):
+    return a - b
+
+
+def bias(close, ma):
+    return (close - ma) / ma * 100
+
+
+def band(middle, std, width):
+    return middle + width * std
+
+
+def positive_part(series):
+    return series.where(series > 0, 0)
+
+
+def negative_part(series):
+    return -series.where(series < 0, 0)
+
+
+def rsi(gain, loss):
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+
+def rsv(close, low_min, high_max):
+    return (close - low_min) / (high_max - low_min) * 100
+
+
+# 移动平均线与乖离率(BIAS)
+for _window in (5, 10, 20, 30):
+    register_indicator(f'MA{_window}', ['Close'], rolling_mean, window=_window)
+for _window in (5, 10, 20):
+    register_indicator(f'BIAS{_window}', ['Close', f'MA{_window}'], bias)
+
+# 布林带：中轨复用MA20，上下轨共用同一个20日标准差
+register_indicator('STD20', ['Close'], rolling_std, intermediate=True, window=20)
+register_indicator('BB_MIDDLE', ['MA20'], lambda ma: ma)
+register_indicator('BB_UPPER', ['MA20', 'STD20'], band, width=2)
+register_indicator('BB_LOWER', ['MA20', 'STD20'], band, width=-2)
+
+# RSI
+register_indicator('DELTA', ['Close'], diff, intermediate=True, lookback=1)
+register_indicator('GAIN', ['DELTA'], positive_part, intermediate=True)
+register_indicator('LOSS', ['DELTA'], negative_part, intermediate=True)
+register_indicator('AVG_GAIN14', ['GAIN'], rolling_mean, intermediate=True, window=14)
+register_indicator('AVG_LOSS14', ['LOSS'], rolling_mean, intermediate=True, window=14)
+register_indicator('RSI', ['AVG_GAIN14', 'AVG_LOSS14'], rsi)
+
+# MACD
+register_indicator('EMA12', ['Close'], ema, intermediate=True, span=12)
+register_indicator('EMA26', ['Close'], ema, intermediate=True, span=26)
+register_indicator('MACD', ['EMA12', 'EMA26'], subtract)
+register_indicator('Signal', ['MACD'], ema, span=9)
+register_indicator('MACD_Hist', ['MACD', 'Signal'], subtract)
+
+# KDJ
+register_indicator('LOW_MIN9', ['Low'], rolling_min, intermediate=True, window=9)
+register_indicator('HIGH_MAX9', ['High'], rolling_max, intermediate=True, window=9)
+register_indicator('RSV', ['Close', 'LOW_MIN9', 'HIGH_MAX9'], rsv)
+register_indicator('K', ['RSV'], rolling_mean, window=3)
+register_indicator('D', ['K'], rolling_mean, window=3)
+register_indicator('J', ['K', 'D'], lambda k, d: 3 * k - 2 * d)
+
+# 默认输出全部非中间指标，按注册顺序排列
+DEFAULT_INDICATORS = [name for name, ind in INDICATORS.items() if not ind.intermediate]
+
+# 常用指标组合
+INDICATOR_SETS = {
+    # 个股分析图表、技术分析点评与支撑压力评分所需指标
+    'analysis': ['MA5', 'MA10', 'MA20', 'MA30', 'BIAS5', 'BIAS10', 'BIAS20',
+                 'BB_MIDDLE', 'BB_UPPER', 'BB_LOWER', 'RSI', 'MACD', 'Signal', 'MACD_Hist'],
+    'full': DEFAULT_INDICATORS,
+}
+
+
+def resolve_indicator_names(names):
+    """将 None / 组合名 / 指标列表统一解析为指标名称列表"""
+    if names is None:
+        return list(DEFAULT_INDICATORS)
+    if isinstance(names, str):
+        return list(INDICATOR_SETS[names])
+    return list(names)
+
+
+def is_recursive(indicator):
+    """是否为递推型指标 (EMA)，其值依赖全部历史而非固定窗口"""
+    return indicator.func is ema
+
+
+def plan_indicators(names):
+    """根据依赖关系生成计算顺序
+
+    对请求的指标做深度优先的拓扑排序，只包含请求指标及其依赖，
+    共享的中间结果只出现一次。
+
+    Args:
+        names: 请求的指标名称列表
+
+    Returns:
+        list: 按计算顺序排列的指标名称 (不含原始数据列)
+
+    Raises:
+        KeyError: 请求了未注册的指标
+        ValueError: 指标之间存在循环依赖
+    """
+    order = []
+    state = {}  # name -> 'visiting' / 'done'
+
+    def visit(name):
+        if name not in INDICATORS:
+            return  # 原始数据列
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"指标存在循环依赖: {name}")
+        state[name] = 'visiting'
+        for dep in INDICATORS[name].inputs:
+            visit(dep)
+        state[name] = 'done'
+        order.append(name)
+
+    for name in names:
+        if name not in INDICATORS:
+            raise KeyError(f"未注册的指标: {name}")
+        visit(name)
+    return order
+
+
+def compute_indicators(df, names=None):
+    """按需计算技术指标并写入DataFrame
+
+    Args:
+        df: DataFrame with OHLC data
+        names: 需要输出的指标名称列表、INDICATOR_SETS 中的组合名，
+               为None时输出 DEFAULT_INDICATORS
+
+    Returns:
+        DataFrame: 原DataFrame，已按请求顺序追加指标列
+    """
+    names = resolve_indicator_names(names)
+
+    values = {}
+    for name in plan_indicators(names):
+        indicator = INDICATORS[name]
+        args = [values[dep] if dep in values else df[dep] for dep in indicator.inputs]
+        values[name] = indicator.func(*args, **indicator.params)
+
+    for name in names:
+        df[name] = values[name]
+    return df
+
+
+PANEL_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def to_wide_panel(long_df, fields=PANEL_FIELDS, symbol_col='symbol', date_col='datetime'):
+    """将带 symbol 列的长表转换为 {字段: 日期×股票 DataFrame} 的宽表面板"""
+    return {field: long_df.pivot(index=date_col, columns=symbol_col, values=field)
+            for field in fields}
+
+
+def compute_panel_indicators(panel, names=None):
+    """在全市场 日期×股票 面板上一次性计算技术指标
+
+    停牌日与上市前日期在面板中为NaN。计算前先把每只股票的有效K线压缩到
+    连续的行上，用同一套指标定义做二维向量化计算，再放回原日期位置，
+    因此结果与逐只股票计算 (停牌日不产生K线) 一致，停牌日的指标为NaN。
+
+    Args:
+        panel: {字段: 日期×股票 DataFrame}，至少包含指标所需的原始字段
+        names: 需要输出的指标名称列表或 INDICATOR_SETS 中的组合名，为None时输出全部指标
+
+    Returns:
+        dict: {指标名: 日期×股票 DataFrame}
+    """
+    names = resolve_indicator_names(names)
+    close = panel['Close']
+    index, columns = close.index, close.columns
+
+    # 以收盘价是否存在判断当日是否有K线，计算每根有效K线在压缩后的行号
+    valid = close.notna().to_numpy()
+    rows, cols = np.nonzero(valid)
+    compact_rows = (np.cumsum(valid, axis=0) - 1)[rows, cols]
+    n_compact = int(valid.sum(axis=0).max()) if valid.size else 0
+
+    def compact(frame):
+        out = np.full((n_compact, len(columns)), np.nan)
+        out[compact_rows, cols] = frame.reindex(index=index, columns=columns).to_numpy(dtype=float)[rows, cols]
+        return pd.DataFrame(out, columns=columns)
+
+    def expand(frame):
+        out = np.full((len(index), len(columns)), np.nan)
+        out[rows, cols] = frame.to_numpy(dtype=float)[compact_rows, cols]
+        return pd.DataFrame(out, index=index, columns=columns)
+
+    values = {}
+    for name in plan_indicators(names):
+        indicator = INDICATORS[name]
+        args = [values[dep] if dep in values else compact(panel[dep]) for dep in indicator.inputs]
+        values[name] = indicator.func(*args, **indicator.params)
+
+    return {name: expand(values[name]) for name in names}
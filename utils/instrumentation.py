@@ -0,0 +1,112 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+
+import numpy as np
+import pandas as pd
+
+# 日志级别可通过环境变量 STOCK_ANALYZER_LOG_LEVEL 调整 (DEBUG/INFO/WARNING/ERROR)
+LOG_LEVEL = os.environ.get('STOCK_ANALYZER_LOG_LEVEL', 'WARNING').upper()
+
+
+def get_logger(name):
+    """获取应用日志记录器，所有记录器共享 stock_analyzer 根记录器的级别与输出"""
+    root = logging.getLogger('stock_analyzer')
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+    return root.getChild(name)
+
+
+class MetricsRegistry:
+    """进程内的耗时统计，每个阶段保留最近 max_samples 次耗时用于计算分位数"""
+
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self.samples = {}
+        self.counts = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds, error=False):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.max_samples)
+                self.counts[stage] = 0
+                self.errors[stage] = 0
+            self.samples[stage].append(seconds)
+            self.counts[stage] += 1
+            self.errors[stage] += int(error)
+
+    def percentile(self, stage, q, min_samples=20):
+        """某阶段最近耗时的 q 分位数 (秒)，样本不足 min_samples 时返回None"""
+        with self.lock:
+            samples = self.samples.get(stage)
+            if samples is None or len(samples) < min_samples:
+                return None
+            return float(np.percentile(np.array(samples), q))
+
+    def summary(self):
+        """返回各阶段的调用次数、错误次数与耗时统计 (毫秒)"""
+        with self.lock:
+            rows = []
+            for stage, samples in self.samples.items():
+                values = np.array(samples) * 1000
+                rows.append({
+                    'stage': stage,
+                    'count': self.counts[stage],
+                    'errors': self.errors[stage],
+                    'mean_ms': values.mean(),
+                    'p50_ms': np.percentile(values, 50),
+                    'p95_ms': np.percentile(values, 95),
+                    'max_ms': values.max(),
+                })
+        columns = ['stage', 'count', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms']
+        return pd.DataFrame(rows, columns=columns).sort_values('stage', ignore_index=True)
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+            self.errors.clear()
+
+
+metrics = MetricsRegistry()
+logger = get_logger('metrics')
+
+
+class timed(ContextDecorator):
+    """记录代码块耗时的上下文管理器/装饰器
+
+    用法：
+        with timed('fetch'):
+            ...
+
+        @timed('plot')
+        def plot(...):
+            ...
+    """
+
+    def __init__(self, stage, registry=None):
+        self.stage = stage
+        self.registry = registry or metrics
+        self.local = threading.local()
+
+    def __enter__(self):
+        # 同一个装饰器实例可能被多个线程同时使用，起始时间按线程保存
+        starts = getattr(self.local, 'starts', [])
+        starts.append(time.perf_counter())
+        self.local.starts = starts
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.local.starts.pop()
+        self.registry.record(self.stage, elapsed, error=exc_type is not None)
+        logger.debug("%s 耗时 %.1fms", self.stage, elapsed * 1000)
+        return False
@@ -1,75 +1,110 @@
-import akshare as ak
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from utils.concurrency import map_concurrent
+from utils.data_store import load_ohlcv
+from utils.gateway import gateway
+from utils.instrumentation import get_logger
+
+logger = get_logger('market_overview')
+
+# 概览中展示的指数
+INDICES = {
+    '上证指数': 'sh000001',
+    '深证成指': 'sz399001',
+    '创业板指': 'sz399006',
+    '科创50': 'sh000688',
+    '上证50': 'sh000016',
+    '沪深300': 'sh000300',
+    '中证500': 'sh000905',
+    '中证1000': 'sh000852'
+}
+
+# 计算最新涨跌幅只需要最近两根K线，回看30天足以跨过长假
+INDEX_LOOKBACK_DAYS = 30
+
+def fetch_index_history(symbol, start_date, end_date, adjust=None):
+    """获取指数日线，列名与个股K线一致 (datetime, Open, Close, High, Low, Volume, Amount)"""
+    df = gateway.call('stock_zh_index_daily_em', 
+        symbol=symbol,
+        start_date=pd.Timestamp(start_date).strftime('%Y%m%d'),
+        end_date=pd.Timestamp(end_date).strftime('%Y%m%d')
+    )
+    if df.empty:
+        return pd.DataFrame(columns=['datetime'])
+    df = df.rename(columns={
+        'date': 'datetime', 'open': 'Open', 'close': 'Close', 'high': 'High',
+        'low': 'Low', 'volume': 'Volume', 'amount': 'Amount'
+    })
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    return df
+
+def get_index_quote(symbol):
+    """获取指数最新行情
+
+    历史K线保存在本地存储中，只请求尚未获取的最近几根K线 (当日K线每次重新获取)。
+
+    Returns:
+        dict: {'最新价', '涨跌幅', '成交额'}，没有数据时返回None
+    """
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=INDEX_LOOKBACK_DAYS)
+    df = load_ohlcv(symbol, start_date, end_date, fetch_index_history, adjust='index')
+    if df.empty:
+        return None
+    # 计算涨跌幅
+    pct_change = (df['Close'] - df['Close'].shift(1)) / df['Close'].shift(1) * 100
+    latest = df.iloc[-1]
+    return {
+        '最新价': latest['Close'],
+        '涨跌幅': pct_change.iloc[-1],
+        '成交额': latest['Amount']
+    }
 
 def get_market_overview():
-    """获取市场概览数据"""
+    """获取市场概览数据
+
+    各指数与行业、概念板块列表并发获取，冷启动耗时约等于单次请求。
+    """
     try:
-        # 获取指数数据
-        indices = {
-            '上证指数': 'sh000001',
-            '深证成指': 'sz399001',
-            '创业板指': 'sz399006',
-            '科创50': 'sh000688',
-            '上证50': 'sh000016',
-            '沪深300': 'sh000300',
-            '中证500': 'sh000905',
-            '中证1000': 'sh000852'
-        }
+        # 指数行情与板块列表同时发出请求
+        tasks = {name: (get_index_quote, code) for name, code in INDICES.items()}
+        tasks['行业板块'] = (gateway.call, 'stock_board_industry_name_em')
+        tasks['概念板块'] = (gateway.call, 'stock_board_concept_name_em')
+        results, failures = map_concurrent(lambda key: tasks[key][0](*tasks[key][1:]), list(tasks),
+                                           max_workers=len(tasks))
+        for key, e in failures.items():
+            logger.warning("Error getting %s data: %s", key, e)
         
-        market_data = {}
-        for name, code in indices.items():
-            try:
-                # 使用 stock_zh_index_daily_em 替代 stock_zh_index_spot
-                df = ak.stock_zh_index_daily_em(symbol=code)
-                if not df.empty:
-                    # 计算涨跌幅
-                    df['pct_change'] = (df['close'] - df['close'].shift(1)) / df['close'].shift(1) * 100
-                    latest = df.iloc[-1]
-                    market_data[name] = {
-                        '最新价': latest['close'],
-                        '涨跌幅': latest['pct_change'],
-                        '成交额': latest['amount']
-                    }
-            except Exception as e:
-                print(f"Error getting index data for {name}: {e}")
-                continue  # 如果获取某个指数失败，继续获取下一个
+        market_data = {name: results[name] for name in INDICES if results.get(name) is not None}
         
-        # 获取行业板块数据
-        try:
-            sector_df = ak.stock_board_industry_name_em()
-            if not sector_df.empty:
-                # 按涨跌幅排序
-                sector_df = sector_df.sort_values('涨跌幅', ascending=False)
-        except Exception as e:
-            print(f"Error getting sector data: {e}")
-            sector_df = None
+        # 行业板块数据
+        sector_df = results.get('行业板块')
+        if sector_df is not None and not sector_df.empty:
+            # 按涨跌幅排序
+            sector_df = sector_df.sort_values('涨跌幅', ascending=False)
             
-        # 获取概念板块数据
-        try:
-            concept_df = ak.stock_board_concept_name_em()
-            if not concept_df.empty:
-                # 按涨跌幅排序
-                concept_df = concept_df.sort_values('涨跌幅', ascending=False)
-                
-                # 计算统计信息
-                total_concepts = len(concept_df)
-                up_count = len(concept_df[concept_df['涨跌幅'] > 0])
-                down_count = len(concept_df[concept_df['涨跌幅'] < 0])
-                flat_count = len(concept_df[concept_df['涨跌幅'] == 0])
-                
-                # 添加统计信息到DataFrame的属性中
-                concept_df.attrs['statistics'] = {
-                    'total': total_concepts,
-                    'up': up_count,
-                    'down': down_count,
-                    'flat': flat_count
-                }
-        except Exception as e:
-            print(f"Error getting concept data: {e}")
-            concept_df = None
+        # 概念板块数据
+        concept_df = results.get('概念板块')
+        if concept_df is not None and not concept_df.empty:
+            # 按涨跌幅排序
+            concept_df = concept_df.sort_values('涨跌幅', ascending=False)
             
+            # 计算统计信息
+            total_concepts = len(concept_df)
+            up_count = len(concept_df[concept_df['涨跌幅'] > 0])
+            down_count = len(concept_df[concept_df['涨跌幅'] < 0])
+            flat_count = len(concept_df[concept_df['涨跌幅'] == 0])
+            
+            # 添加统计信息到DataFrame的属性中
+            concept_df.attrs['statistics'] = {
+                'total': total_concepts,
+                'up': up_count,
+                'down': down_count,
+                'flat': flat_count
+            }
+        
         return market_data, sector_df, concept_df
     except Exception as e:
-        print(f"Error getting market overview: {e}")
+        logger.exception("Error getting market overview: %s", e)
         return {}, None, None
\ No newline at end of file
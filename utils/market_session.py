@@ -0,0 +1,189 @@
+import functools
+import threading
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+
+from utils.instrumentation import get_logger
+
+# A股交易时段。收盘后行情数据还会更新几分钟，
+# 收盘后 SETTLE_MINUTES 分钟内获取的数据仍按盘中数据处理
+SESSIONS = ((time(9, 30), time(11, 30)), (time(13, 0), time(15, 0)))
+SETTLE_MINUTES = 5
+# 向后查找下一个交易日的最大天数 (足以跨过春节、国庆长假)
+MAX_LOOKAHEAD_DAYS = 30
+
+# 本地没有交易日历时从接口获取，获取失败后 ONLINE_RETRY_SECONDS 秒内不再重试
+ONLINE_RETRY_SECONDS = 600
+
+logger = get_logger('market_session')
+
+_calendar_lock = threading.Lock()
+_calendar_cache = {'version': None, 'dates': None, 'source': None, 'loaded_at': None}
+
+
+def _read_local_trade_dates():
+    # 延迟导入：datasets 依赖 gateway，而 gateway 的缓存策略依赖本模块
+    from utils.datasets import load_dataset
+
+    try:
+        df = load_dataset('trade_calendar')
+    except Exception as e:
+        logger.warning("读取本地交易日历失败: %s", e)
+        return None
+    return frozenset(df['trade_date'].dt.date) if df is not None else None
+
+
+def _fetch_online_trade_dates():
+    """从交易日历接口获取
+
+    绕过网关缓存直接经由数据后端请求：网关缓存按本模块的策略计算有效期，
+    经缓存请求会在计算有效期时再次进入本函数。
+    """
+    from utils.gateway import gateway
+
+    try:
+        df = gateway.guard.call(gateway.backend, 'tool_trade_date_hist_sina')
+        return frozenset(pd.to_datetime(df['trade_date']).dt.date)
+    except Exception as e:
+        logger.warning("获取交易日历失败: %s", e)
+        return None
+
+
+def load_trade_dates():
+    """获取交易日历
+
+    优先读取刷新程序维护的本地交易日历 (按数据集版本号缓存)；本地没有时从接口获取
+    (每天重新获取一次)；两者都失败时返回None，调用方按周一到周五判断交易日。
+
+    Returns:
+        frozenset: 交易日 (date)，无法获取时返回None
+    """
+    from utils.datasets import dataset_version
+
+    version = dataset_version('trade_calendar')
+    now = datetime.now()
+    with _calendar_lock:
+        cache = _calendar_cache
+        loaded_at = cache['loaded_at']
+        stale = (
+            cache['version'] != version
+            or (cache['source'] == 'online' and loaded_at.date() != now.date())
+            or (cache['source'] is None and (now - loaded_at).total_seconds() >= ONLINE_RETRY_SECONDS)
+        )
+        if stale:
+            dates, source = _read_local_trade_dates(), 'local'
+            if dates is None:
+                dates, source = _fetch_online_trade_dates(), 'online'
+            if dates is None:
+                source = None
+                logger.warning("没有可用的交易日历，暂按周一到周五判断交易日 (节假日会被当作交易日)")
+            cache.update(version=version, dates=dates, source=source, loaded_at=now)
+        return cache['dates']
+
+
+@functools.lru_cache(maxsize=4)
+def _calendar_range(trade_dates):
+    return min(trade_dates), max(trade_dates)
+
+
+def is_trading_day(day, trade_dates=None):
+    """是否为交易日
+
+    交易日历覆盖该日期时以日历为准，否则按周一到周五判断。
+    """
+    trade_dates = load_trade_dates() if trade_dates is None else trade_dates
+    if trade_dates:
+        first, last = _calendar_range(frozenset(trade_dates))
+        if first <= day <= last:
+            return day in trade_dates
+    return day.weekday() < 5
+
+
+def session_bounds(day, settle=False):
+    """某天各交易时段的 (开始, 结束) 时间，settle 为True时结束时间加上收盘后的延迟"""
+    delay = timedelta(minutes=SETTLE_MINUTES if settle else 0)
+    return [(datetime.combine(day, start), datetime.combine(day, end) + delay) for start, end in SESSIONS]
+
+
+def is_trading_time(now=None, settle=False, trade_dates=None):
+    """当前是否处于交易时段"""
+    now = now or datetime.now()
+    if not is_trading_day(now.date(), trade_dates):
+        return False
+    return any(start <= now < end for start, end in session_bounds(now.date(), settle))
+
+
+def _trading_days_from(day, trade_dates):
+    for offset in range(MAX_LOOKAHEAD_DAYS + 1):
+        candidate = day + timedelta(days=offset)
+        if is_trading_day(candidate, trade_dates):
+            yield candidate
+
+
+def next_open(now=None, trade_dates=None):
+    """下一个交易时段的开始时间 (包括午间休市后的开盘)"""
+    now = now or datetime.now()
+    for day in _trading_days_from(now.date(), trade_dates):
+        for start, _ in session_bounds(day):
+            if start > now:
+                return start
+    return now + timedelta(days=1)
+
+
+def next_close(now=None, trade_dates=None):
+    """下一次收盘数据定稿的时间 (收盘时间加上 SETTLE_MINUTES)"""
+    now = now or datetime.now()
+    for day in _trading_days_from(now.date(), trade_dates):
+        close = session_bounds(day, settle=True)[-1][1]
+        if close > now:
+            return close
+    return now + timedelta(days=1)
+
+
+class SessionPolicy:
+    """按交易时段计算缓存有效期
+
+    - 盘中数据 (intraday_ttl 不为None)：交易时段内获取的缓存 intraday_ttl 秒，
+      休市 (午休、收盘后、周末、节假日) 时获取的缓存到下一个交易时段开始
+    - 日频数据 (intraday_ttl 为None)：缓存到下一次收盘数据定稿
+
+    Args:
+        intraday_ttl: 交易时段内的有效秒数，None 表示日频数据
+    """
+
+    def __init__(self, intraday_ttl=None):
+        self.intraday_ttl = intraday_ttl
+
+    def ttl(self, now=None, trade_dates=None):
+        """now 时获取的数据的有效秒数"""
+        now = now or datetime.now()
+        trade_dates = load_trade_dates() if trade_dates is None else trade_dates
+        if self.intraday_ttl is not None and is_trading_time(now, settle=True, trade_dates=trade_dates):
+            return self.intraday_ttl
+        return max((self.expires_at(now, trade_dates) - now).total_seconds(), 0)
+
+    def expires_at(self, now=None, trade_dates=None):
+        """now 所在缓存窗口的结束时间
+
+        同一窗口内调用返回相同的值，可作为 st.cache_data 函数的参数，
+        窗口结束后参数变化，缓存自然失效。交易时段内按 intraday_ttl 对齐分段。
+        """
+        now = now or datetime.now()
+        trade_dates = load_trade_dates() if trade_dates is None else trade_dates
+        if self.intraday_ttl is None:
+            return next_close(now, trade_dates)
+        if is_trading_time(now, settle=True, trade_dates=trade_dates):
+            day_start = datetime.combine(now.date(), time())
+            elapsed = (now - day_start).total_seconds()
+            return day_start + timedelta(seconds=(elapsed // self.intraday_ttl + 1) * self.intraday_ttl)
+        return next_open(now, trade_dates)
+
+    def __repr__(self):
+        return f"SessionPolicy(intraday_ttl={self.intraday_ttl})"
+
+
+# 常用策略：实时行情、板块涨跌等盘中变化的数据，以及每日收盘后才变化的数据
+REALTIME = SessionPolicy(60)
+INTRADAY = SessionPolicy(300)
+DAILY = SessionPolicy()
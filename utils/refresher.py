@@ -0,0 +1,103 @@
+"""后台数据刷新程序，独立于 Streamlit 进程运行
+
+用法:
+    python -m utils.refresher --once                    # 刷新全部数据集一次
+    python -m utils.refresher --at 18:30                # 每天 18:30 刷新
+    python -m utils.refresher --interval 3600 stock_list trade_calendar
+
+每个数据集先写入临时文件再原子替换，替换完成后递增 data/versions.json 中的版本号，
+运行中的应用据此重新加载，无需重启。
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from utils.data_preprocessor import MAX_CHECKPOINT_AGE_DAYS, preprocess_sector_data
+from utils.datasets import DATASET_FILES, refresh_stock_list, refresh_trade_calendar
+from utils.instrumentation import get_logger, timed
+from utils.sector_store import migrate_legacy_json
+
+logger = get_logger('refresher')
+
+
+def refresh_sectors(max_workers=8, rate=5, max_checkpoint_age_days=MAX_CHECKPOINT_AGE_DAYS):
+    """增量刷新板块归属 (只重新获取成分股数量可能变化或检查点过旧的板块)"""
+    data = preprocess_sector_data(test_mode=False, max_workers=max_workers, rate=rate, incremental=True,
+                                  max_checkpoint_age_days=max_checkpoint_age_days)
+    if data is None:
+        raise RuntimeError("板块数据预处理失败")
+    return data['metadata']['total_stocks']
+
+
+def run_refresh(datasets, max_workers=8, rate=5, max_checkpoint_age_days=MAX_CHECKPOINT_AGE_DAYS):
+    """依次刷新指定的数据集，单个数据集失败不影响其他数据集
+
+    Returns:
+        dict: {数据集: 是否成功}
+    """
+    refreshers = {
+        'sectors': lambda: refresh_sectors(max_workers, rate, max_checkpoint_age_days),
+        'stock_list': refresh_stock_list,
+        'trade_calendar': refresh_trade_calendar,
+    }
+    status = {}
+    for name in datasets:
+        try:
+            with timed(f"refresh_{name}"):
+                result = refreshers[name]()
+            logger.info("刷新 %s 完成: %s", name, result)
+            status[name] = True
+        except Exception as e:
+            logger.error("刷新 %s 失败: %s", name, e)
+            status[name] = False
+    return status
+
+
+def next_run_time(now, at):
+    """下一次每日定时刷新的时间"""
+    hour, minute = map(int, at.split(':'))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return target if target > now else target + timedelta(days=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="定时刷新板块归属、股票列表与交易日历")
+    parser.add_argument('datasets', nargs='*',
+                        help=f"要刷新的数据集 ({', '.join(DATASET_FILES)})，默认全部")
+    schedule = parser.add_mutually_exclusive_group()
+    schedule.add_argument('--once', action='store_true', help="只刷新一次后退出")
+    schedule.add_argument('--interval', type=int, help="每隔多少秒刷新一次")
+    schedule.add_argument('--at', help="每天的刷新时间，格式 HH:MM")
+    parser.add_argument('--workers', type=int, default=8, help="板块成分股并发线程数")
+    parser.add_argument('--rate', type=float, default=5, help="每秒最多请求数")
+    parser.add_argument('--max-checkpoint-age', type=float, default=MAX_CHECKPOINT_AGE_DAYS,
+                        help="板块检查点的最长使用天数。增量刷新按上涨+下跌家数估计成分股数量是否变化，"
+                             "这只是启发式判断 (不含平盘、停牌股票，也发现不了数量不变的成分股替换)，"
+                             "检查点超过该天数后强制重新获取")
+    parser.add_argument('--log-level', default='INFO', help="日志级别")
+    args = parser.parse_args(argv)
+    logger.parent.setLevel(args.log_level.upper())
+    datasets = args.datasets or list(DATASET_FILES)
+    unknown = [name for name in datasets if name not in DATASET_FILES]
+    if unknown:
+        parser.error(f"未知的数据集: {', '.join(unknown)}")
+
+    # 只有旧版 sector_data.json 时先转换为数据库，应用无需等到下一次板块刷新
+    migrate_legacy_json()
+
+    if args.once or (args.interval is None and args.at is None):
+        status = run_refresh(datasets, args.workers, args.rate, args.max_checkpoint_age)
+        return 0 if all(status.values()) else 1
+
+    while True:
+        if args.at:
+            wake = next_run_time(datetime.now(), args.at)
+            logger.info("下一次刷新时间: %s", wake.strftime('%Y-%m-%d %H:%M'))
+            time.sleep(max(0, (wake - datetime.now()).total_seconds()))
+        run_refresh(datasets, args.workers, args.rate, args.max_checkpoint_age)
+        if args.interval:
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,285 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+import requests
+
+from utils.instrumentation import get_logger, metrics
+
+logger = get_logger('resilience')
+
+# 单次接口调用的耗时上限 (秒)，超时后调用方不再等待 (由缓存回退到旧值)
+ENDPOINT_BUDGETS = {
+    'stock_zh_index_spot': 10,
+    'stock_board_industry_name_em': 10,
+    'stock_board_concept_name_em': 10,
+    'stock_board_industry_hist_em': 15,
+    'stock_board_industry_cons_em': 10,
+    'stock_board_concept_cons_em': 10,
+    'stock_zh_a_spot_em': 30,      # 全市场快照分页获取，耗时较长
+    'stock_info_a_code_name': 60,
+    'tool_trade_date_hist_sina': 15,
+    'stock_zh_a_hist': 15,
+    'stock_zh_index_daily_em': 10,
+}
+DEFAULT_BUDGET = 15
+# 允许发送对冲请求的接口：幂等且返回数据量小的读取接口。
+# 全市场快照与股票列表数据量大，对冲只会加重上游负担
+HEDGED_ENDPOINTS = {
+    'stock_board_industry_name_em',
+    'stock_board_concept_name_em',
+    'stock_board_industry_cons_em',
+    'stock_board_concept_cons_em',
+    'stock_zh_a_hist',
+    'stock_zh_index_daily_em',
+}
+# 对冲延迟取该接口最近耗时的 HEDGE_PERCENTILE 分位数，样本不足时不对冲
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+# 连续 FAILURE_THRESHOLD 次网络层失败 (连接错误、超时) 后熔断，COOLDOWN 秒后放行一个探测请求。
+# 参数错误、空板块等接口正常响应后的异常说明上游可用，不计入失败
+FAILURE_THRESHOLD = 5
+COOLDOWN = 30
+# 批量获取 (预处理、批量K线) 遇到熔断时等待恢复而不是立即失败，最多等待 MAX_BREAKER_WAIT 秒
+MAX_BREAKER_WAIT = 300
+# 每个接口使用独立的线程池，同时执行的请求数上限。
+# 挂起的请求只占用本接口的线程，不影响其他接口；排队超过耗时上限的请求会被取消，不会再发出
+MAX_INFLIGHT_PER_ENDPOINT = 8
+# 网络层异常：计入熔断器的失败次数
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    ConnectionError, TimeoutError)
+
+
+class CircuitOpenError(RuntimeError):
+    """接口已熔断，请求未发出"""
+
+
+class BudgetExceededError(TimeoutError):
+    """接口调用超过耗时上限"""
+
+
+def is_transport_error(error):
+    """是否为网络层异常 (含超过耗时上限与 5xx 响应)"""
+    if isinstance(error, TRANSPORT_ERRORS):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """单个接口的熔断器
+
+    - closed: 正常放行，连续失败达到阈值后转为 open
+    - open: 直接拒绝，冷却时间过后转为 half_open
+    - half_open: 只放行一个探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """是否放行本次请求"""
+        with self.lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def wait_until_allowed(self, max_wait=MAX_BREAKER_WAIT):
+        """熔断时等待冷却结束并取得放行，超过 max_wait 秒仍未放行时返回False"""
+        deadline = time.monotonic() + max_wait
+        while not self.allow():
+            with self.lock:
+                if self.state == 'open':
+                    delay = self.opened_at + self.cooldown - time.monotonic()
+                else:
+                    delay = 0.5   # 其他调用正在探测，稍后再检查
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(max(delay, 0.05), remaining))
+        return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """为上游接口调用加上耗时上限、熔断与对冲请求
+
+    - 每次调用在该接口独立的线程池中执行，超过耗时上限时抛出 BudgetExceededError，
+      调用线程 (如 Streamlit 脚本线程) 不会被挂起的请求阻塞；
+      挂起的请求只占满本接口的线程池，其他接口不受影响，排队未开始的请求超时后取消
+    - 每个接口一个熔断器，只有网络层异常计入失败。熔断期间直接抛出 CircuitOpenError，
+      由缓存回退到旧值；批量调用方可以选择等待熔断恢复
+    - HEDGED_ENDPOINTS 中的接口在第一个请求超过历史 p95 耗时仍未返回时，
+      再发送一个相同请求，采用先成功返回的结果
+    - 各接口的耗时记录在 metrics 的 akshare.<接口名> 阶段，用于计算对冲延迟
+
+    Args:
+        budgets: {接口名: 耗时上限秒数}，默认 ENDPOINT_BUDGETS
+        hedged: 允许对冲的接口集合，默认 HEDGED_ENDPOINTS；传入空集合关闭对冲
+        max_inflight: 每个接口同时执行的请求数上限
+    """
+
+    def __init__(self, budgets=None, hedged=None, max_inflight=MAX_INFLIGHT_PER_ENDPOINT):
+        self.budgets = dict(ENDPOINT_BUDGETS if budgets is None else budgets)
+        self.hedged = set(HEDGED_ENDPOINTS if hedged is None else hedged)
+        self.max_inflight = max_inflight
+        self.executors = {}
+        self.breakers = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def _breaker(self, endpoint):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker()
+            return self.breakers[endpoint]
+
+    def _executor(self, endpoint):
+        with self.lock:
+            if endpoint not in self.executors:
+                self.executors[endpoint] = ThreadPoolExecutor(
+                    max_workers=self.max_inflight, thread_name_prefix=f"akshare-{endpoint}")
+            return self.executors[endpoint]
+
+    def _count(self, endpoint, field):
+        with self.lock:
+            counters = self.counters.setdefault(endpoint, {
+                'calls': 0, 'timeouts': 0, 'cancelled': 0, 'short_circuited': 0,
+                'breaker_waits': 0, 'hedged': 0, 'hedge_wins': 0
+            })
+            counters[field] += 1
+
+    def _submit(self, backend, endpoint, args, kwargs):
+        stage = f"akshare.{endpoint}"
+
+        def run():
+            start = time.perf_counter()
+            try:
+                result = backend.call(endpoint, *args, **kwargs)
+            except Exception:
+                metrics.record(stage, time.perf_counter() - start, error=True)
+                raise
+            metrics.record(stage, time.perf_counter() - start)
+            return result
+
+        return self._executor(endpoint).submit(run)
+
+    def hedge_delay(self, endpoint):
+        """对冲请求的发送延迟 (秒)，不允许对冲或样本不足时返回None"""
+        if endpoint not in self.hedged:
+            return None
+        return metrics.percentile(f"akshare.{endpoint}", HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+
+    def call(self, backend, endpoint, *args, wait_breaker=False, **kwargs):
+        """经由 backend 调用接口
+
+        Args:
+            wait_breaker: 熔断时等待冷却结束后再发出请求 (用于不依赖缓存的批量获取)，
+                          默认立即抛出 CircuitOpenError
+
+        Returns:
+            接口返回值；熔断时抛出 CircuitOpenError，超时抛出 BudgetExceededError
+        """
+        breaker = self._breaker(endpoint)
+        if not breaker.allow():
+            if not wait_breaker:
+                self._count(endpoint, 'short_circuited')
+                raise CircuitOpenError(f"{endpoint} 已熔断")
+            self._count(endpoint, 'breaker_waits')
+            logger.info("%s 已熔断，等待冷却结束", endpoint)
+            if not breaker.wait_until_allowed():
+                self._count(endpoint, 'short_circuited')
+                raise CircuitOpenError(f"{endpoint} 熔断超过 {MAX_BREAKER_WAIT}s 未恢复")
+        self._count(endpoint, 'calls')
+
+        budget = self.budgets.get(endpoint, DEFAULT_BUDGET)
+        deadline = time.monotonic() + budget
+        pending = {self._submit(backend, endpoint, args, kwargs)}
+        primary = next(iter(pending))
+        error = None
+
+        delay = self.hedge_delay(endpoint)
+        if delay is not None and delay < budget:
+            done, pending = wait(pending, timeout=delay)
+            # 第一个请求仍在排队时不对冲，对冲请求只会排在它后面
+            if not done and primary.running():
+                self._count(endpoint, 'hedged')
+                logger.debug("%s 超过 p95 (%.0fms) 未返回，发送对冲请求", endpoint, delay * 1000)
+                pending.add(self._submit(backend, endpoint, args, kwargs))
+            pending |= done
+
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count(endpoint, 'hedge_wins')
+                    self._cancel(endpoint, pending)
+                    breaker.record_success()
+                    return future.result()
+                error = future.exception()
+
+        if pending:
+            self._cancel(endpoint, pending)
+            self._count(endpoint, 'timeouts')
+            breaker.record_failure()
+            logger.warning("%s 超过耗时上限 %ss", endpoint, budget)
+            raise BudgetExceededError(f"{endpoint} 超过耗时上限 {budget}s")
+        if is_transport_error(error):
+            breaker.record_failure()
+        else:
+            # 上游正常响应，只是请求本身出错 (参数错误、空板块等)
+            breaker.record_success()
+        raise error
+
+    def _cancel(self, endpoint, futures):
+        """取消仍在排队的请求，已开始执行的请求无法中断"""
+        for future in futures:
+            if future.cancel():
+                self._count(endpoint, 'cancelled')
+
+    def stats(self):
+        """各接口的熔断状态、连续失败、超时、熔断拒绝与对冲次数"""
+        with self.lock:
+            rows = []
+            for endpoint, counters in self.counters.items():
+                breaker = self.breakers[endpoint]
+                rows.append({
+                    'endpoint': endpoint,
+                    'state': breaker.state,
+                    'failures': breaker.failures,
+                    **counters,
+                    'budget_s': self.budgets.get(endpoint, DEFAULT_BUDGET),
+                })
+        columns = ['endpoint', 'state', 'failures', 'calls', 'timeouts', 'cancelled', 'short_circuited',
+                   'breaker_waits', 'hedged', 'hedge_wins', 'budget_s']
+        return pd.DataFrame(rows, columns=columns).sort_values('endpoint', ignore_index=True)
@@ -0,0 +1,218 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+from utils.data_store import DATA_DIR
+from utils.instrumentation import get_logger
+
+logger = get_logger('sector_history')
+
+# 板块归属历史：每次预处理只记录与上一次相比新增 (+1) 和移除 (-1) 的归属关系，
+# 任意日期的归属等于该日期及之前全部变化的累加，存储量与变化量成正比
+SECTOR_HISTORY_FILES = {False: 'sector_history.db', True: 'sector_history_test.db'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    snapshot_date TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL,
+    added INTEGER NOT NULL,
+    removed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sectors (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (kind, name)
+);
+CREATE TABLE IF NOT EXISTS deltas (
+    snapshot_id INTEGER NOT NULL,
+    sector_id INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    action INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, sector_id, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS deltas_by_sector ON deltas (sector_id, code);
+CREATE INDEX IF NOT EXISTS deltas_by_code ON deltas (code);
+"""
+
+
+def sector_history_path(test_mode=False, data_dir=DATA_DIR):
+    """归属历史数据库路径"""
+    return os.path.join(data_dir, SECTOR_HISTORY_FILES[bool(test_mode)])
+
+
+def connect_history(path):
+    """打开 (必要时创建) 归属历史数据库"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _normalize_date(date):
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
+
+
+def _memberships_as_of(conn, snapshot_date, inclusive=True):
+    """返回 {(sector_id, code)}：截至某日 (含/不含当日) 的归属关系"""
+    op = '<=' if inclusive else '<'
+    rows = conn.execute(
+        f"SELECT d.sector_id, d.code FROM deltas d JOIN snapshots s ON s.id = d.snapshot_id "
+        f"WHERE s.snapshot_date {op} ? GROUP BY d.sector_id, d.code HAVING SUM(d.action) > 0",
+        (snapshot_date,)
+    ).fetchall()
+    return set(rows)
+
+
+def record_snapshot(memberships, snapshot_date=None, path=None, keep_sectors=()):
+    """记录一次板块归属快照，只保存与上一次快照的差异
+
+    同一日期重复记录时替换当日的差异；早于最新快照的日期不能再写入。
+
+    Args:
+        memberships: (股票代码, 类型, 板块名称) 的迭代器，如 SectorStore.iter_memberships()
+        snapshot_date: 快照日期，默认为今天
+        path: 历史数据库路径，默认 data/sector_history.db
+        keep_sectors: [(类型, 板块名称)]，本次获取失败的板块，其归属沿用上一次快照
+
+    Returns:
+        dict: {'date', 'added', 'removed'}，写入失败时返回None
+    """
+    path = path or sector_history_path()
+    snapshot_date = _normalize_date(snapshot_date or datetime.now())
+    conn = connect_history(path)
+    try:
+        latest = conn.execute("SELECT MAX(snapshot_date) FROM snapshots").fetchone()[0]
+        if latest is not None and snapshot_date < latest:
+            logger.warning("快照日期 %s 早于最新快照 %s，未记录", snapshot_date, latest)
+            return None
+
+        with conn:
+            conn.execute(
+                "DELETE FROM deltas WHERE snapshot_id IN (SELECT id FROM snapshots WHERE snapshot_date = ?)",
+                (snapshot_date,)
+            )
+            conn.execute("DELETE FROM snapshots WHERE snapshot_date = ?", (snapshot_date,))
+            previous = _memberships_as_of(conn, snapshot_date, inclusive=False)
+
+            sector_ids = {(kind, name): sector_id
+                          for sector_id, kind, name in conn.execute("SELECT id, kind, name FROM sectors")}
+
+            def sector_id(key):
+                if key not in sector_ids:
+                    sector_ids[key] = conn.execute(
+                        "INSERT INTO sectors (kind, name) VALUES (?, ?)", key
+                    ).lastrowid
+                return sector_ids[key]
+
+            current = set()
+            for code, kind, sector_name in memberships:
+                current.add((sector_id((kind, sector_name)), code))
+            # 获取失败的板块沿用上一次的归属，避免被误记为全部移除
+            kept_ids = {sector_ids[key] for key in keep_sectors if key in sector_ids}
+            current = {m for m in current if m[0] not in kept_ids}
+            current |= {m for m in previous if m[0] in kept_ids}
+
+            added = current - previous
+            removed = previous - current
+            snapshot_id = conn.execute(
+                "INSERT INTO snapshots (snapshot_date, created_at, added, removed) VALUES (?, ?, ?, ?)",
+                (snapshot_date, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(added), len(removed))
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO deltas (snapshot_id, sector_id, code, action) VALUES (?, ?, ?, ?)",
+                [(snapshot_id, sid, code, 1) for sid, code in added] +
+                [(snapshot_id, sid, code, -1) for sid, code in removed]
+            )
+        return {'date': snapshot_date, 'added': len(added), 'removed': len(removed)}
+    finally:
+        conn.close()
+
+
+def list_snapshots(path=None):
+    """列出全部快照及其新增/移除数量"""
+    conn = connect_history(path or sector_history_path())
+    try:
+        return pd.read_sql_query(
+            "SELECT snapshot_date, created_at, added, removed FROM snapshots ORDER BY snapshot_date", conn
+        )
+    finally:
+        conn.close()
+
+
+def membership_as_of(date, path=None, kind=None, sector_name=None):
+    """重建某一日期的板块归属
+
+    使用该日期及之前最近一次快照的状态；早于首个快照的日期返回空结果。
+
+    Args:
+        date: 查询日期
+        path: 历史数据库路径
+        kind: 只返回该类型的板块
+        sector_name: 只返回该板块 (需同时指定 kind)
+
+    Returns:
+        dict: {(类型, 板块名称): [股票代码]}，股票代码升序
+    """
+    conn = connect_history(path or sector_history_path())
+    try:
+        conditions = ["s.snapshot_date <= ?"]
+        params = [_normalize_date(date)]
+        if kind is not None:
+            conditions.append("sec.kind = ?")
+            params.append(kind)
+        if sector_name is not None:
+            conditions.append("sec.name = ?")
+            params.append(sector_name)
+        rows = conn.execute(
+            "SELECT sec.kind, sec.name, d.code FROM deltas d "
+            "JOIN snapshots s ON s.id = d.snapshot_id JOIN sectors sec ON sec.id = d.sector_id "
+            f"WHERE {' AND '.join(conditions)} "
+            "GROUP BY d.sector_id, d.code HAVING SUM(d.action) > 0 ORDER BY sec.id, d.code",
+            params
+        ).fetchall()
+    finally:
+        conn.close()
+
+    membership = {}
+    for sector_kind, name, code in rows:
+        membership.setdefault((sector_kind, name), []).append(code)
+    return membership
+
+
+def membership_changes(path=None, code=None, kind=None, sector_name=None, start_date=None, end_date=None):
+    """查询归属变化记录 (如某只股票何时加入/移出某个概念)
+
+    Returns:
+        DataFrame: 列为 date, kind, sector, code, action ('加入'/'移出')，按日期升序
+    """
+    conditions = []
+    params = []
+    for column, value in (('d.code', code), ('sec.kind', kind), ('sec.name', sector_name)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if start_date is not None:
+        conditions.append("s.snapshot_date >= ?")
+        params.append(_normalize_date(start_date))
+    if end_date is not None:
+        conditions.append("s.snapshot_date <= ?")
+        params.append(_normalize_date(end_date))
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+
+    conn = connect_history(path or sector_history_path())
+    try:
+        changes = pd.read_sql_query(
+            "SELECT s.snapshot_date AS date, sec.kind AS kind, sec.name AS sector, d.code AS code, "
+            "d.action AS action FROM deltas d "
+            "JOIN snapshots s ON s.id = d.snapshot_id JOIN sectors sec ON sec.id = d.sector_id "
+            f"{where}ORDER BY s.snapshot_date, sec.id, d.code",
+            conn, params=params
+        )
+    finally:
+        conn.close()
+    changes['action'] = changes['action'].map({1: '加入', -1: '移出'})
+    return changes
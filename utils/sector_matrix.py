@@ -0,0 +1,193 @@
+import os
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+from utils.data_store import DATA_DIR, atomic_write
+from utils.sector_store import SECTOR_KINDS
+
+# 股票×板块归属稀疏矩阵，由 data_preprocessor 与板块归属数据库一同写入
+SECTOR_MATRIX_FILES = {False: 'sector_matrix.npz', True: 'sector_matrix_test.npz'}
+
+
+def sector_matrix_path(test_mode=False, data_dir=DATA_DIR):
+    """归属矩阵文件路径"""
+    return os.path.join(data_dir, SECTOR_MATRIX_FILES[bool(test_mode)])
+
+
+class SectorMatrix:
+    """股票×板块的稀疏布尔归属矩阵 (CSR)
+
+    行为股票、列为板块，第 i 只股票所属板块的列号为 indices[indptr[i]:indptr[i+1]]。
+    同时保存按板块排列的转置 (板块→股票行号)，交集与共同成分统计都在
+    整数数组上向量化完成，不再逐个遍历嵌套列表。
+
+    Args:
+        codes: 股票代码数组，对应矩阵的行
+        sectors: [(类型, 板块名称)]，对应矩阵的列
+        indptr: CSR 行指针，长度为股票数 + 1
+        indices: CSR 列号
+    """
+
+    def __init__(self, codes, sectors, indptr, indices):
+        self.codes = np.asarray(codes)
+        self.sectors = [tuple(sector) for sector in sectors]
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.sector_ids = {sector: i for i, sector in enumerate(self.sectors)}
+        self.code_ids = {code: i for i, code in enumerate(self.codes)}
+
+        # 转置 (CSC)：每个板块的成分股行号，行号在板块内升序
+        rows = np.repeat(np.arange(len(self.codes), dtype=np.int32), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind='stable')
+        self.sector_rows = rows[order]
+        self.sector_indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(self.indices, minlength=len(self.sectors)))]
+        )
+        self.sizes = np.diff(self.sector_indptr)
+
+    @property
+    def shape(self):
+        return len(self.codes), len(self.sectors)
+
+    @classmethod
+    def from_stocks(cls, stocks):
+        """从 {股票代码: {'name', 'industry', 'concept'}} 构建"""
+        sector_ids = {}
+        indptr = [0]
+        indices = []
+        for info in stocks.values():
+            row = set()
+            for kind in SECTOR_KINDS:
+                for sector_name in info.get(kind, []):
+                    row.add(sector_ids.setdefault((kind, sector_name), len(sector_ids)))
+            indices.extend(sorted(row))
+            indptr.append(len(indices))
+        return cls(list(stocks), list(sector_ids), indptr, indices)
+
+    @classmethod
+    def from_memberships(cls, memberships):
+        """从按股票排列的 (股票代码, 类型, 板块名称) 迭代器构建，如 SectorStore.iter_memberships()"""
+        codes = []
+        sector_ids = {}
+        indptr = [0]
+        indices = []
+        for code, rows in groupby(memberships, key=itemgetter(0)):
+            codes.append(code)
+            indices.extend(sorted({sector_ids.setdefault((kind, name), len(sector_ids)) for _, kind, name in rows}))
+            indptr.append(len(indices))
+        return cls(codes, list(sector_ids), indptr, indices)
+
+    def save(self, path):
+        """保存为 .npz 文件 (原子替换)"""
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    codes=self.codes.astype(str),
+                    sector_kinds=np.array([kind for kind, _ in self.sectors], dtype=str),
+                    sector_names=np.array([name for _, name in self.sectors], dtype=str),
+                    indptr=self.indptr,
+                    indices=self.indices,
+                )
+        atomic_write(path, write)
+
+    @classmethod
+    def load(cls, path):
+        """从 .npz 文件加载"""
+        with np.load(path) as data:
+            sectors = list(zip(data['sector_kinds'].tolist(), data['sector_names'].tolist()))
+            return cls(data['codes'], sectors, data['indptr'], data['indices'])
+
+    def sector_columns(self, kind=None):
+        """某类板块的列号数组，kind 为None时为全部板块"""
+        if kind is None:
+            return np.arange(len(self.sectors))
+        return np.array([i for i, (sector_kind, _) in enumerate(self.sectors) if sector_kind == kind],
+                        dtype=np.int64)
+
+    def _rows(self, kind, sector_name):
+        sector_id = self.sector_ids.get((kind, sector_name))
+        if sector_id is None:
+            return np.array([], dtype=np.int32)
+        return self.sector_rows[self.sector_indptr[sector_id]:self.sector_indptr[sector_id + 1]]
+
+    def members(self, kind, sector_name):
+        """板块的成分股代码"""
+        return self.codes[self._rows(kind, sector_name)].tolist()
+
+    def intersect(self, sectors):
+        """同时属于多个板块的股票
+
+        Args:
+            sectors: [(类型, 板块名称)]
+
+        Returns:
+            list: 股票代码
+        """
+        rows = None
+        for kind, sector_name in sectors:
+            sector_rows = self._rows(kind, sector_name)
+            rows = sector_rows if rows is None else np.intersect1d(rows, sector_rows, assume_unique=True)
+        return [] if rows is None else self.codes[rows].tolist()
+
+    def co_membership(self, kind, sector_name, target_kind=None):
+        """某个板块与其他板块的共同成分股数量
+
+        Args:
+            kind: 板块类型
+            sector_name: 板块名称
+            target_kind: 只统计该类型的板块，为None时统计全部板块
+
+        Returns:
+            DataFrame: 列为 kind, sector, shared, size, jaccard，按 shared 降序，不含板块自身
+        """
+        rows = self._rows(kind, sector_name)
+        # 成分股所属板块的列号全部展开后计数，即该板块列与每一列的内积
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        columns = self.indices[np.arange(lengths.sum()) + offsets]
+        shared = np.bincount(columns, minlength=len(self.sectors))
+
+        candidates = self.sector_columns(target_kind)
+        self_id = self.sector_ids.get((kind, sector_name))
+        candidates = candidates[(candidates != self_id) & (shared[candidates] > 0)]
+        union = len(rows) + self.sizes[candidates] - shared[candidates]
+        result = pd.DataFrame({
+            'kind': [self.sectors[i][0] for i in candidates],
+            'sector': [self.sectors[i][1] for i in candidates],
+            'shared': shared[candidates],
+            'size': self.sizes[candidates],
+            'jaccard': shared[candidates] / union,
+        })
+        return result.sort_values(['shared', 'jaccard'], ascending=False, ignore_index=True)
+
+    def dense(self, kind=None):
+        """返回 股票×板块 的稠密 0/1 矩阵 (float32)，只含 kind 类型的列"""
+        columns = self.sector_columns(kind)
+        position = np.full(len(self.sectors), -1)
+        position[columns] = np.arange(len(columns))
+        rows = np.repeat(np.arange(len(self.codes)), np.diff(self.indptr))
+        keep = position[self.indices] >= 0
+        matrix = np.zeros((len(self.codes), len(columns)), dtype=np.float32)
+        matrix[rows[keep], position[self.indices[keep]]] = 1
+        return matrix
+
+    def co_membership_matrix(self, kind='concept'):
+        """板块两两之间的共同成分股数量矩阵 (MᵀM)"""
+        matrix = self.dense(kind)
+        names = [self.sectors[i][1] for i in self.sector_columns(kind)]
+        counts = (matrix.T @ matrix).round().astype(np.int64)
+        return pd.DataFrame(counts, index=names, columns=names)
+
+    def jaccard(self, kind='concept'):
+        """板块两两之间的 Jaccard 相似度矩阵：|A∩B| / |A∪B|"""
+        shared = self.co_membership_matrix(kind)
+        sizes = np.diag(shared.values)
+        union = sizes[:, None] + sizes[None, :] - shared.values
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(union > 0, shared.values / union, 0.0)
+        return pd.DataFrame(values, index=shared.index, columns=shared.columns)
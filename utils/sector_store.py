@@ -0,0 +1,394 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from utils.data_store import DATA_DIR, atomic_write, make_temp_path, remove_temp, replace_from_temp
+from utils.instrumentation import get_logger
+
+# 股票-板块归属的 SQLite 存储，替代整体解析的 sector_data.json。
+# 股票与板块名称按字典编码存入 stocks / sectors 表，归属关系只保存 (股票编号, 板块编号)，
+# 两个方向各有一个索引，股票→板块、板块→股票均为索引查找，无需加载全部数据。
+SECTOR_DB_FILES = {False: 'sector_data.db', True: 'sector_data_test.db'}
+SECTOR_JSON_FILES = {False: 'sector_data.json', True: 'sector_data_test.json'}
+SECTOR_KINDS = ('industry', 'concept')
+
+logger = get_logger('sector_store')
+_migrate_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE sectors (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (kind, name)
+);
+CREATE TABLE stocks (
+    id INTEGER PRIMARY KEY,
+    code TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL
+);
+CREATE TABLE memberships (
+    stock_id INTEGER NOT NULL,
+    sector_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (stock_id, sector_id)
+) WITHOUT ROWID;
+CREATE INDEX memberships_by_sector ON memberships (sector_id, stock_id);
+"""
+
+
+def sector_store_path(test_mode=False, data_dir=DATA_DIR):
+    """板块归属数据库路径"""
+    return os.path.join(data_dir, SECTOR_DB_FILES[bool(test_mode)])
+
+
+def write_sector_store(path, data):
+    """将 {'metadata': ..., 'stocks': {代码: {'name', 'industry', 'concept'}}} 写入数据库
+
+    'stocks' 也可以是 (代码, 信息) 的迭代器，逐条写入。
+    先写入临时文件再原子替换，读取方不会看到写了一半的数据库。
+    """
+    def write(tmp_path):
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript(SCHEMA)
+            conn.executemany(
+                "INSERT INTO metadata (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False))
+                 for key, value in data.get('metadata', {}).items()]
+            )
+            sector_ids = {}
+            stock_rows = []
+            membership_rows = []
+
+            def flush():
+                # 分批写入，逐条导入时内存占用不随数据量增长
+                conn.executemany("INSERT INTO stocks (id, code, name) VALUES (?, ?, ?)", stock_rows)
+                conn.executemany(
+                    "INSERT INTO memberships (stock_id, sector_id, position) VALUES (?, ?, ?)",
+                    membership_rows
+                )
+                stock_rows.clear()
+                membership_rows.clear()
+
+            stocks = data['stocks']
+            records = stocks.items() if isinstance(stocks, dict) else stocks
+            for stock_id, (code, info) in enumerate(records, start=1):
+                stock_rows.append((stock_id, code, info['name']))
+                position = 0
+                for kind in SECTOR_KINDS:
+                    for sector_name in info.get(kind, []):
+                        key = (kind, sector_name)
+                        if key not in sector_ids:
+                            sector_ids[key] = len(sector_ids) + 1
+                        membership_rows.append((stock_id, sector_ids[key], position))
+                        position += 1
+                if len(stock_rows) >= 1000:
+                    flush()
+            flush()
+            conn.executemany(
+                "INSERT INTO sectors (id, kind, name) VALUES (?, ?, ?)",
+                [(sector_id, kind, name) for (kind, name), sector_id in sector_ids.items()]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    atomic_write(path, write)
+
+
+class SectorStoreWriter:
+    """逐个板块写入板块归属数据库
+
+    预处理每合并一个板块就写入其成分股，不在内存中构建完整的股票→板块映射，
+    内存占用只与股票数量有关 (代码→编号字典)，不随板块与归属关系的数量增长。
+    板块编号按写入顺序分配并作为归属的排列位置，按板块列表顺序写入时
+    get_stock 返回的板块顺序与原先逐只股票合并的结果一致。
+
+    写入临时文件，commit 时写入元数据并原子替换目标文件；abort 丢弃临时文件。
+
+    Args:
+        path: 数据库文件路径
+        metadata: 预处理元数据，commit 前可继续修改 writer.metadata
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = dict(metadata or {})
+        self.tmp_path = make_temp_path(path)
+        self.conn = sqlite3.connect(self.tmp_path)
+        self.conn.executescript(SCHEMA)
+        self.stock_ids = {}
+        self.sector_ids = {}
+        self.closed = False
+
+    @property
+    def stock_count(self):
+        return len(self.stock_ids)
+
+    def add_board(self, kind, board_name, members):
+        """写入一个板块的成分股
+
+        Args:
+            kind: 'industry' 或 'concept'
+            board_name: 板块名称
+            members: (股票代码, 股票名称) 的迭代器
+        """
+        stock_rows = []
+        member_ids = []
+        for code, name in members:
+            stock_id = self.stock_ids.get(code)
+            if stock_id is None:
+                stock_id = self.stock_ids[code] = len(self.stock_ids) + 1
+                stock_rows.append((stock_id, code, name))
+            member_ids.append(stock_id)
+        if not member_ids:
+            return
+
+        key = (kind, board_name)
+        sector_id = self.sector_ids.get(key)
+        if sector_id is None:
+            sector_id = self.sector_ids[key] = len(self.sector_ids) + 1
+            self.conn.execute("INSERT INTO sectors (id, kind, name) VALUES (?, ?, ?)", (sector_id, kind, board_name))
+        self.conn.executemany("INSERT INTO stocks (id, code, name) VALUES (?, ?, ?)", stock_rows)
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO memberships (stock_id, sector_id, position) VALUES (?, ?, ?)",
+            [(stock_id, sector_id, sector_id) for stock_id in member_ids]
+        )
+
+    def commit(self):
+        """写入元数据并替换目标文件"""
+        try:
+            self.conn.executemany(
+                "INSERT INTO metadata (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False)) for key, value in self.metadata.items()]
+            )
+            self.conn.commit()
+            self.conn.close()
+            self.closed = True
+            replace_from_temp(self.tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """放弃写入，删除临时文件 (已提交或已放弃时不做任何事)"""
+        if not self.closed:
+            self.conn.close()
+            self.closed = True
+        remove_temp(self.tmp_path)
+
+
+class SectorStore:
+    """只读的板块归属数据库
+
+    连接可在多个线程间共享 (查询时加锁)，适合作为进程级资源缓存。
+
+    Args:
+        path: 数据库文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def metadata(self):
+        """返回预处理时记录的元数据"""
+        return {key: json.loads(value) for key, value in self._query("SELECT key, value FROM metadata")}
+
+    def get_stock(self, code):
+        """查询股票所属板块
+
+        Returns:
+            dict: {'name': 股票名称, 'industry': [行业], 'concept': [概念]}，未找到时返回None
+        """
+        rows = self._query("SELECT id, name FROM stocks WHERE code = ?", (code,))
+        if not rows:
+            return None
+        stock_id, stock_name = rows[0]
+        info = {'name': stock_name, 'industry': [], 'concept': []}
+        for kind, name in self._query(
+            "SELECT s.kind, s.name FROM memberships m JOIN sectors s ON s.id = m.sector_id "
+            "WHERE m.stock_id = ? ORDER BY m.position", (stock_id,)
+        ):
+            info[kind].append(name)
+        return info
+
+    def get_sector_stocks(self, kind, sector_name):
+        """查询板块的成分股
+
+        Returns:
+            list: [(股票代码, 股票名称)]，按股票代码排序；板块不存在时返回空列表
+        """
+        return self._query(
+            "SELECT st.code, st.name FROM sectors s "
+            "JOIN memberships m ON m.sector_id = s.id "
+            "JOIN stocks st ON st.id = m.stock_id "
+            "WHERE s.kind = ? AND s.name = ? ORDER BY st.code", (kind, sector_name)
+        )
+
+    def list_stocks(self):
+        """返回全部股票 [(股票代码, 股票名称)]，按股票代码排序"""
+        return self._query("SELECT code, name FROM stocks ORDER BY code")
+
+    def list_sectors(self, kind=None):
+        """返回板块名称列表，kind 为None时返回 [(类型, 名称)]"""
+        if kind is None:
+            return self._query("SELECT kind, name FROM sectors ORDER BY id")
+        return [name for name, in self._query("SELECT name FROM sectors WHERE kind = ? ORDER BY id", (kind,))]
+
+    def iter_memberships(self, batch_size=10000):
+        """逐批读取全部归属关系，按股票、板块顺序排列，不一次性加载
+
+        Yields:
+            (股票代码, 类型, 板块名称)
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT st.code, s.kind, s.name FROM memberships m "
+                "JOIN sectors s ON s.id = m.sector_id JOIN stocks st ON st.id = m.stock_id "
+                "ORDER BY m.stock_id, m.position"
+            )
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def to_dict(self):
+        """导出为与 sector_data.json 中 'stocks' 相同结构的字典 (保持原有顺序)"""
+        stocks = {code: {'name': name, 'industry': [], 'concept': []}
+                  for code, name in self._query("SELECT code, name FROM stocks ORDER BY id")}
+        for code, kind, name in self._query(
+            "SELECT st.code, s.kind, s.name FROM memberships m "
+            "JOIN sectors s ON s.id = m.sector_id JOIN stocks st ON st.id = m.stock_id "
+            "ORDER BY m.stock_id, m.position"
+        ):
+            stocks[code][kind].append(name)
+        return stocks
+
+    def close(self):
+        self.conn.close()
+
+
+class MembershipIndex:
+    """常驻内存的板块归属索引，查询接口与 SectorStore 相同
+
+    一次性从数据库加载全部归属关系，股票→板块、板块→股票均为字典查找。
+    返回的字典与列表由所有调用方共享，调用方不应修改。
+
+    Args:
+        stocks: {股票代码: {'name', 'industry', 'concept'}}
+        metadata: 预处理元数据
+    """
+
+    def __init__(self, stocks, metadata=None):
+        self.stocks = stocks
+        self._metadata = metadata or {}
+        self.sectors = {}
+        for code, info in stocks.items():
+            for kind in SECTOR_KINDS:
+                for sector_name in info.get(kind, []):
+                    self.sectors.setdefault((kind, sector_name), []).append(code)
+        for codes in self.sectors.values():
+            codes.sort()
+        self.sorted_stocks = sorted((code, info['name']) for code, info in stocks.items())
+
+    @classmethod
+    def from_store(cls, store):
+        """从 SectorStore 加载"""
+        return cls(store.to_dict(), store.metadata())
+
+    def metadata(self):
+        return self._metadata
+
+    def get_stock(self, code):
+        return self.stocks.get(code)
+
+    def get_sector_stocks(self, kind, sector_name):
+        return [(code, self.stocks[code]['name']) for code in self.sectors.get((kind, sector_name), [])]
+
+    def list_stocks(self):
+        return self.sorted_stocks
+
+    def list_sectors(self, kind=None):
+        if kind is None:
+            return list(self.sectors)
+        return [name for sector_kind, name in self.sectors if sector_kind == kind]
+
+    def to_dict(self):
+        return self.stocks
+
+
+def convert_json_to_store(json_path, db_path=None):
+    """将已有的 sector_data.json 导入数据库
+
+    Args:
+        json_path: JSON 文件路径
+        db_path: 数据库路径，默认与 JSON 同目录同名 (.db)
+
+    Returns:
+        str: 数据库路径
+    """
+    if db_path is None:
+        db_path = os.path.splitext(json_path)[0] + '.db'
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    write_sector_store(db_path, data)
+    return db_path
+
+
+def open_sector_store(test_mode=False, data_dir=DATA_DIR):
+    """打开板块归属数据库，数据库不存在时先转换旧版 JSON (见 migrate_legacy_json)
+
+    Returns:
+        SectorStore，数据库与旧版 JSON 都不存在时返回None
+    """
+    path = sector_store_path(test_mode, data_dir)
+    if not os.path.exists(path):
+        migrate_legacy_json(test_mode, data_dir)
+    if not os.path.exists(path):
+        return None
+    return SectorStore(path)
+
+
+def migrate_legacy_json(test_mode=False, data_dir=DATA_DIR):
+    """数据库不存在但有旧版 JSON 文件时转换 (只转换一次)
+
+    仓库中只有 sector_data.json，新检出的代码由应用首次读取板块归属时转换；
+    刷新程序启动时也会调用。转换在进程内加锁，写入使用唯一的临时文件后原子替换，
+    多个进程同时转换时结果相同，不会读到写了一半的数据库。
+
+    Returns:
+        str: 转换得到的数据库路径，无需转换时返回None
+    """
+    path = sector_store_path(test_mode, data_dir)
+    json_path = os.path.join(data_dir, SECTOR_JSON_FILES[bool(test_mode)])
+    with _migrate_lock:
+        if os.path.exists(path) or not os.path.exists(json_path):
+            return None
+        logger.info("板块归属数据库不存在，从 %s 转换", json_path)
+        return convert_json_to_store(json_path, path)
+
+
+if __name__ == "__main__":
+    # 用法: python -m utils.sector_store data/sector_data.json [data/sector_data.db]
+    if len(sys.argv) < 2:
+        print("用法: python -m utils.sector_store <sector_data.json> [输出 .db 路径]")
+        sys.exit(1)
+    json_path = sys.argv[1]
+    db_path = convert_json_to_store(json_path, sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"已转换 {json_path} -> {db_path}")
+    print(f"文件大小: {os.path.getsize(json_path) / 1024:.2f} KB -> {os.path.getsize(db_path) / 1024:.2f} KB")
@@ -0,0 +1,366 @@
+import numpy as np
+import pandas as pd
+
+# 各评分项满分
+SCORE_WEIGHTS = {
+    'volume': 20,        # 价位成交量占比
+    'large_trade': 15,   # 大单交易占比
+    'bounce': 20,        # 反弹/回落力度
+    'breakout': 15,      # 突破失败次数
+    'recency': 12,       # 最近触及权重
+    'history': 8,        # 历史形成时间
+    'indicator': 10,     # 技术指标确认
+}
+
+
+def score_level_strength(prices, df, tolerance=0.005, recent_bars=20):
+    """批量计算支撑/压力位的强度分数 (0-100)
+
+    所有候选价位一次性构造 价位×K线 的布尔矩阵，避免逐根K线的Python循环。
+
+    计分项目：
+    1. 成交量分析 (35分)
+        - 价位成交量占比 (20分)
+        - 大单交易占比 (15分)
+    2. 价格动量分析 (35分)
+        - 反弹/回落力度 (20分)
+        - 突破失败次数 (15分)
+    3. 时间衰减分析 (20分)
+        - 最近触及权重 (12分)
+        - 历史形成时间 (8分)
+    4. 技术指标确认 (10分)
+        - 与其他指标配合 (10分)
+
+    Args:
+        prices: 候选价位序列
+        df: DataFrame with OHLC data (需包含 Volume 和 Amount 列)
+        tolerance: 触及判定的相对价格区间 (默认0.5%)
+        recent_bars: 近期触及统计的K线数量
+
+    Returns:
+        dict: 各评分项的分数数组 (键同 SCORE_WEIGHTS)、'total' 总分数组，
+              以及 'volume_ratio'、'large_trade_ratio'、'avg_bounce'、
+              'failed_breakouts'、'recent_touches' 等原始统计量
+    """
+    prices = np.asarray(prices, dtype=float)
+    n_bars = len(df)
+    empty = np.zeros(len(prices))
+    if len(prices) == 0 or n_bars == 0:
+        result = {key: empty.copy() for key in SCORE_WEIGHTS}
+        result.update(total=empty.copy(), volume_ratio=empty.copy(),
+                      large_trade_ratio=empty.copy(), avg_bounce=empty.copy(),
+                      failed_breakouts=empty.copy(), recent_touches=empty.copy())
+        return result
+
+    close = df['Close'].to_numpy(dtype=float)
+    high = df['High'].to_numpy(dtype=float)
+    low = df['Low'].to_numpy(dtype=float)
+    volume = df['Volume'].to_numpy(dtype=float)
+    amount = df['Amount'].to_numpy(dtype=float)
+
+    p = prices[:, None]
+    threshold = p * tolerance
+    close_touch = np.abs(close[None, :] - p) <= threshold  # 收盘价触及矩阵
+    low_touch = np.abs(low[None, :] - p) <= threshold      # 最低价触及矩阵
+
+    # 1. 成交量分析 (35分)
+    # 1.1 价位成交量占比 (20分)
+    total_volume = volume.sum()
+    volume_ratio = close_touch @ volume / total_volume if total_volume else empty.copy()
+    volume_score = np.minimum(volume_ratio * 200, 20)  # 需要10%的成交量才能得满分
+
+    # 1.2 大单交易占比 (15分) - 使用成交额作为替代指标
+    total_amount = amount.sum()
+    large_trade_ratio = close_touch @ amount / total_amount if total_amount else empty.copy()
+    large_trade_score = np.minimum(large_trade_ratio * 150, 15)  # 需要10%的成交额才能得满分
+
+    # 2. 价格动量分析 (35分)
+    # 只统计存在前后K线的位置 (1 .. n-2)
+    inner = np.zeros(n_bars, dtype=bool)
+    inner[1:-1] = True
+    inner_touch = low_touch & inner[None, :]
+
+    # 2.1 反弹/回落力度 (20分)
+    next_high = np.roll(high, -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bounce = (next_high - low) / low
+    bounce_sum = np.where(inner_touch, bounce[None, :], 0).sum(axis=1)
+    bounce_count = inner_touch.sum(axis=1)
+    avg_bounce = np.divide(bounce_sum, bounce_count,
+                           out=np.zeros(len(prices)), where=bounce_count > 0)
+    bounce_score = np.minimum(avg_bounce * 400, 20)  # 需要5%的平均反弹幅度才能得满分
+
+    # 2.2 突破失败次数 (15分)
+    next_close = np.roll(close, -1)
+    failed_breakouts = (inner_touch
+                        & (close[None, :] > p)
+                        & (next_close[None, :] < p)).sum(axis=1)
+    breakout_score = np.minimum(failed_breakouts * 3, 15)  # 每次失败突破3分，最高15分
+
+    # 3. 时间衰减分析 (20分)
+    # 3.1 最近触及权重 (12分)
+    recent_touches = close_touch[:, max(0, n_bars - recent_bars):].sum(axis=1)
+    recency_score = np.minimum(recent_touches * 3, 12)  # 每次近期触及3分，最高12分
+
+    # 3.2 历史形成时间 (8分)
+    touched = close_touch.any(axis=1)
+    first_touch_idx = close_touch.argmax(axis=1)
+    history_score = np.where(
+        touched, np.minimum((n_bars - first_touch_idx) / n_bars * 8, 8), 0)
+
+    # 4. 技术指标确认 (10分)
+    last_close = close[-1]
+    below = prices < last_close
+    above = prices > last_close
+    indicator_score = np.zeros(len(prices))
+
+    # RSI确认
+    if 'RSI' in df.columns:
+        rsi = df['RSI'].iloc[-1]
+        indicator_score += np.where((below & (rsi < 30)) | (above & (rsi > 70)), 3, 0)
+
+    # MACD确认
+    if 'MACD' in df.columns and 'Signal' in df.columns:
+        macd = df['MACD'].iloc[-1]
+        signal = df['Signal'].iloc[-1]
+        indicator_score += np.where((below & (macd > signal)) | (above & (macd < signal)), 3, 0)
+
+    # 布林带确认
+    if 'BB_UPPER' in df.columns and 'BB_LOWER' in df.columns:
+        bb_upper = df['BB_UPPER'].iloc[-1]
+        bb_lower = df['BB_LOWER'].iloc[-1]
+        near_lower = np.abs(prices - bb_lower) / prices < 0.02
+        near_upper = np.abs(prices - bb_upper) / prices < 0.02
+        indicator_score += np.where((below & near_lower) | (above & near_upper), 4, 0)
+
+    total = np.round(
+        volume_score + large_trade_score + bounce_score + breakout_score
+        + recency_score + history_score + indicator_score,
+        2
+    )
+
+    return {
+        'volume': volume_score,
+        'large_trade': large_trade_score,
+        'bounce': bounce_score,
+        'breakout': breakout_score,
+        'recency': recency_score,
+        'history': history_score,
+        'indicator': indicator_score,
+        'total': total,
+        'volume_ratio': volume_ratio,
+        'large_trade_ratio': large_trade_ratio,
+        'avg_bounce': avg_bounce,
+        'failed_breakouts': failed_breakouts,
+        'recent_touches': recent_touches,
+    }
+
+
+def find_fractals(df, windows=(20,)):
+    """使用Williams分形理论寻找分形顶底
+
+    基于滑动窗口最大/最小值判断：某根K线的最高价严格大于前后各 window 根K线的
+    最高价即为顶分形，最低价严格小于前后各 window 根K线的最低价即为底分形。
+    每个窗口只需两次滚动极值计算，复杂度与窗口大小无关。
+
+    Args:
+        df: DataFrame with OHLC data
+        windows: 窗口大小，可以是单个整数或多个整数
+
+    Returns:
+        DataFrame: 每行一个分形，列为 window、kind ('top'/'bottom')、
+                   bar (K线位置)、datetime (日期) 和 price (分形价位)，
+                   依次按窗口、顶/底分形、K线位置排列
+    """
+    if np.isscalar(windows):
+        windows = (windows,)
+
+    high = df['High'].astype(float).reset_index(drop=True)
+    low = df['Low'].astype(float).reset_index(drop=True)
+    dates = df['datetime'].to_numpy() if 'datetime' in df.columns else df.index.to_numpy()
+
+    frames = []
+    for window in windows:
+        for kind, series, sign in (('top', high, 1), ('bottom', low, -1)):
+            # 统一转换为求最大值：底分形取负后等价于顶分形
+            values = series * sign
+            prev_max = values.rolling(window).max().shift(1)
+            next_max = values[::-1].rolling(window).max()[::-1].shift(-1)
+            bars = np.flatnonzero(((values > prev_max) & (values > next_max)).to_numpy())
+            frames.append(pd.DataFrame({
+                'window': window,
+                'kind': kind,
+                'bar': bars,
+                'datetime': dates[bars],
+                'price': series.to_numpy()[bars],
+            }))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def calculate_volume_profile(df, num_bins=100, value_area=0.7):
+    """计算成交量分布 (Volume Profile)
+
+    每根K线的成交量按 最低价-最高价 区间均匀分摊到各价格区间，而不是全部
+    计入收盘价。分摊通过对区间端点做 bincount 再求累积和完成，计算量为
+    O(K线数 + 区间数)，无需逐区间扫描全表。
+
+    Args:
+        df: DataFrame with OHLC data
+        num_bins: 价格区间数量
+        value_area: 价值区域包含的成交量占比 (默认70%)
+
+    Returns:
+        dict: bin_edges (区间边界)、prices (区间中心价)、volumes (各区间成交量)、
+              poc (成交量最大的价位)、vah / val (价值区域上沿/下沿)
+    """
+    data = df[['High', 'Low', 'Volume']].astype(float).dropna()
+    high = data['High'].to_numpy()
+    low = data['Low'].to_numpy()
+    volume = data['Volume'].to_numpy()
+
+    if len(data) == 0:
+        edges = np.histogram_bin_edges([], bins=num_bins)
+    else:
+        edges = np.histogram_bin_edges(np.concatenate([low, high]), bins=num_bins)
+    width = edges[1] - edges[0]
+    prices = (edges[:-1] + edges[1:]) / 2
+
+    # 以区间宽度为单位的K线上下沿位置
+    lo = np.clip((low - edges[0]) / width, 0, num_bins)
+    hi = np.clip((high - edges[0]) / width, 0, num_bins)
+    span = hi - lo
+    flat = span <= 0
+
+    # 一字线：成交量全部计入所在区间
+    flat_idx = np.minimum(lo[flat].astype(int), num_bins - 1)
+    volumes = np.bincount(flat_idx, weights=volume[flat], minlength=num_bins).astype(float)
+
+    # 其余K线：累积成交量 G(x) 是分段线性函数，斜率在 lo 处增加 d、在 hi 处减少 d
+    # G(j) = Σ c·(j - pos)，对 pos < j 的端点求和，用 bincount + cumsum 计算
+    density = volume[~flat] / span[~flat]
+    pos = np.concatenate([lo[~flat], hi[~flat]])
+    coef = np.concatenate([density, -density])
+    idx = np.floor(pos).astype(int) + 1
+    slope = np.cumsum(np.bincount(idx, weights=coef, minlength=num_bins + 2))[:num_bins + 1]
+    offset = np.cumsum(np.bincount(idx, weights=coef * pos, minlength=num_bins + 2))[:num_bins + 1]
+    cumulative = np.arange(num_bins + 1) * slope - offset
+    volumes += np.diff(cumulative)
+    volumes = np.maximum(volumes, 0)  # 消除浮点误差产生的极小负数
+
+    # 价值区域：从 POC 开始，每次并入上下相邻区间中成交量较大的一个，
+    # 直至覆盖 value_area 占比。区域始终连续，双峰分布时不会把两峰之间的空档算进去
+    poc = int(np.argmax(volumes))
+    target = volumes.sum() * value_area
+    lower = upper = poc
+    covered = volumes[poc]
+    while covered < target and (lower > 0 or upper < num_bins - 1):
+        below = volumes[lower - 1] if lower > 0 else -1.0
+        above = volumes[upper + 1] if upper < num_bins - 1 else -1.0
+        if above >= below:
+            upper += 1
+            covered += above
+        else:
+            lower -= 1
+            covered += below
+
+    return {
+        'bin_edges': edges,
+        'prices': prices,
+        'volumes': volumes,
+        'poc': prices[poc],
+        'vah': edges[upper + 1],
+        'val': edges[lower],
+    }
+
+
+def volume_profile_levels(df, num_bins=100, top_ratio=0.2):
+    """从成交量分布中提取高成交量价位作为支撑压力位
+
+    Args:
+        df: DataFrame with OHLC data
+        num_bins: 价格区间数量
+        top_ratio: 取成交量最大的区间比例 (默认前20%)
+
+    Returns:
+        supports: List of (price, volume_share) tuples below current price
+        resistances: List of (price, volume_share) tuples above current price
+    """
+    profile = calculate_volume_profile(df, num_bins=num_bins)
+    prices = profile['prices']
+    volumes = profile['volumes']
+    total_volume = volumes.sum()
+    if total_volume <= 0:
+        return [], []
+
+    # 取前 top_ratio 的高成交量价位
+    num_levels = int(len(prices) * top_ratio)
+    top = np.sort(np.argsort(-volumes, kind='stable')[:num_levels])
+    shares = volumes[top] / total_volume
+
+    # 区分支撑位和压力位
+    current_price = df['Close'].iloc[-1]
+    supports = [(p, v) for p, v in zip(prices[top], shares) if p < current_price]
+    resistances = [(p, v) for p, v in zip(prices[top], shares) if p > current_price]
+
+    return supports, resistances
+
+
+# 支撑压力位来源算法代码，与 analysis.analyze_support_resistance 中的描述对应
+LEVEL_SOURCES = {
+    'pivot': '1',     # 枢轴点位法
+    'volume': '2',    # 成交量分布法
+    'fractal': '3',   # 分形理论法
+}
+
+
+def calculate_atr(df, period=14):
+    """计算最新的平均真实波幅 (ATR)"""
+    prev_close = df['Close'].shift(1)
+    true_range = pd.concat([
+        df['High'] - df['Low'],
+        (df['High'] - prev_close).abs(),
+        (df['Low'] - prev_close).abs(),
+    ], axis=1).max(axis=1)
+    return true_range.rolling(window=period, min_periods=1).mean().iloc[-1]
+
+
+def cluster_levels(levels, threshold=0.02, atr=None):
+    """对候选价位进行单次有序扫描聚类
+
+    价位排序后依次与当前聚类的均值比较 (均值由累计和与计数维护)，
+    距离在阈值内则并入当前聚类，否则开启新聚类。
+
+    Args:
+        levels: List of (price, source) tuples，source 为 LEVEL_SOURCES 中的代码
+        threshold: 聚类阈值。未提供 atr 时为相对均值的比例，
+                   提供 atr 时为 ATR 的倍数
+        atr: 平均真实波幅，提供时按绝对距离 threshold * atr 聚类
+
+    Returns:
+        List of (avg_price, count, sources) tuples，按价格升序，
+        sources 为该聚类包含的来源代码 (升序去重)
+    """
+    if not levels:
+        return []
+
+    prices = np.array([p for p, _ in levels], dtype=float)
+    sources = np.array([s for _, s in levels], dtype=object)
+    order = np.argsort(prices, kind='stable')
+
+    clusters = []
+    total, count, members = 0.0, 0, set()
+    for price, source in zip(prices[order], sources[order]):
+        if count:
+            mean = total / count
+            distance = abs(price - mean)
+            within = distance < threshold * atr if atr is not None else distance / mean < threshold
+            if not within:
+                clusters.append((mean, count, sorted(members)))
+                total, count, members = 0.0, 0, set()
+        total += price
+        count += 1
+        members.add(source)
+    clusters.append((total / count, count, sorted(members)))
+
+    return clusters
@@ -1,9 +1,14 @@
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
-import akshare as ak
 from datetime import datetime
 
+from utils.gateway import gateway
+from utils.instrumentation import get_logger, timed
+
+logger = get_logger('visualization')
+
+@timed('plot')
 def plot_stock_analysis(df_plot, symbol, trade_cal):
     """Create interactive stock analysis plot using Plotly"""
     
@@ -77,15 +82,13 @@ def plot_stock_analysis(df_plot, symbol, trade_cal):
 
     # Add support and resistance levels visualization
     if 'support_levels' in df_plot.columns and 'resistance_levels' in df_plot.columns:
-        print("\n开始绘制支撑位和压力位...")
         support_levels = df_plot['support_levels'].iloc[0]
         resistance_levels = df_plot['resistance_levels'].iloc[0]
         support_strengths = df_plot['support_strengths'].iloc[0] if 'support_strengths' in df_plot.columns else None
         resistance_strengths = df_plot['resistance_strengths'].iloc[0] if 'resistance_strengths' in df_plot.columns else None
         
-        print(f"从数据中获取到:")
-        print(f"- 支撑位: {[round(x, 2) for x in support_levels] if support_levels else '无'}")
-        print(f"- 压力位: {[round(x, 2) for x in resistance_levels] if resistance_levels else '无'}")
+        logger.debug("绘制支撑位 %s, 压力位 %s",
+                     [round(x, 2) for x in support_levels], [round(x, 2) for x in resistance_levels])
         
         # 创建支撑压力位的可视化
         current_price = df_plot['Close'].iloc[-1]
@@ -685,7 +688,7 @@ def plot_sector_stocks_heatmap(sector_name, sector_stocks):
 def get_stock_name(symbol):
     """Get stock name from symbol"""
     try:
-        df = ak.stock_info_a_code_name()
+        df = gateway.call('stock_info_a_code_name')
         stock_info = df[df['code'] == symbol]
         if not stock_info.empty:
             return stock_info.iloc[0]['name']